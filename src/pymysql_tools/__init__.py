@@ -38,6 +38,9 @@ Caveats
 """
 
 from .db import MySQLTools
+from .cache import AnalyseCache
+from .columns import NumericColumn, DictionaryColumn, ObjectColumn
+from .sync import sync_table
 
 __all__ = []
 
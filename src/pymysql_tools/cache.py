@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Persistent cache for table analyses
+@author: Christian Ebeling
+@contact: chr.ebeling@gmail.com
+entries are stored in a pickle file together with a change marker of the table,
+an entry is only valid as long as the change marker of the table is unchanged"""
+
+import os
+import pickle
+import tempfile
+
+from collections import OrderedDict
+
+
+class AnalyseCache:
+    """LRU cache of `MySQLTools.analyse_table` results stored in a pickle file
+
+    :param file_location: path to the pickle file (created on first save)
+    :param max_entries: maximal number of cached tables, least recently used entries are evicted
+    """
+
+    def __init__(self, file_location, max_entries=1000):
+        self.file_location = file_location
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        """load entries from file, a missing or unreadable file results in an empty cache"""
+        if os.path.isfile(self.file_location):
+            try:
+                with open(self.file_location, 'rb') as fd:
+                    self.entries = OrderedDict(pickle.load(fd))
+            except (pickle.UnpicklingError, EOFError, ValueError, TypeError):
+                self.entries = OrderedDict()
+
+    def save(self):
+        """write all entries to file (atomic replace)"""
+        folder = os.path.dirname(os.path.abspath(self.file_location))
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            pickle.dump(list(self.entries.items()), tmp_file)
+        os.replace(tmp_path, self.file_location)
+
+    def get(self, key, marker):
+        """returns cached analysis if marker is unchanged else None
+        :param key: cache key (tuple)
+        :param marker: current change marker of the table, None is never a hit
+        """
+        entry = self.entries.get(key)
+        if marker is None or entry is None or entry[0] != marker:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, marker, analysis):
+        """store analysis for key with change marker and evict least recently used entries
+        :param key: cache key (tuple)
+        :param marker: change marker of the table, None is not stored
+        :param analysis: result of `MySQLTools.analyse_table`
+        """
+        if marker is None:
+            self.entries.pop(key, None)
+            return
+        self.entries[key] = (marker, analysis)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """remove one entry or (key=None) all entries"""
+        if key is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.entries)
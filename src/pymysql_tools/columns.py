@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Array backed column buffers for MySQLTools.fetch_columns
+@author: Christian Ebeling
+@contact: chr.ebeling@gmail.com
+numeric columns are stored in array.array (one machine value per cell instead of one python object),
+strings of low cardinality are dictionary encoded, NumPy is optional"""
+
+import re
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# MySQL DATA_TYPE => (array typecode signed, array typecode unsigned, python converter)
+TYPECODES = {
+    'tinyint': ('b', 'B', int),
+    'smallint': ('h', 'H', int),
+    'mediumint': ('i', 'I', int),
+    'int': ('i', 'I', int),
+    'integer': ('i', 'I', int),
+    'bigint': ('q', 'Q', int),
+    'year': ('H', 'H', int),
+    'float': ('f', 'f', float),
+    'double': ('d', 'd', float),
+    'real': ('d', 'd', float),
+    'decimal': ('d', 'd', float),
+    'numeric': ('d', 'd', float),
+}
+
+# decimals with more digits can not be stored exactly in a C double, they are kept as decimal.Decimal
+MAX_DOUBLE_PRECISION = 15
+
+STRING_TYPES = ('char', 'varchar', 'tinytext', 'text', 'mediumtext', 'longtext', 'enum', 'set')
+
+
+class NumericColumn:
+    """numeric column in an array.array, NULLs are stored as 0 and flagged in nulls (only for nullable columns)"""
+
+    def __init__(self, typecode, converter, nullable):
+        self.values = array(typecode)
+        self.nulls = array('B') if nullable else None
+        self.converter = converter
+
+    def append(self, value):
+        if value is None:
+            self.values.append(0)
+            self.nulls.append(1)
+        else:
+            self.values.append(self.converter(value))
+            if self.nulls is not None:
+                self.nulls.append(0)
+
+    def to_numpy(self):
+        """returns numpy array (masked array if column is nullable), without copy of the values"""
+        values = numpy.frombuffer(self.values, dtype=self.values.typecode)
+        if self.nulls is None:
+            return values
+        return numpy.ma.masked_array(values, mask=numpy.frombuffer(self.nulls, dtype=numpy.uint8).astype(bool))
+
+    def __len__(self):
+        return len(self.values)
+
+
+class DictionaryColumn:
+    """string column, dictionary encoded as long as the number of distinct values is <= max_size
+    codes refer to positions in dictionary, NULL has the code -1
+    if max_size is exceeded the column falls back to a plain list of strings (codes is None)"""
+
+    def __init__(self, max_size, dictionary=None, index=None):
+        self.codes = array('i')
+        self.dictionary = [] if dictionary is None else dictionary
+        self.index = {} if index is None else index
+        self.max_size = max_size
+        self.values = None
+
+    def append(self, value):
+        if self.codes is None:
+            self.values.append(value)
+            return
+        if value is None:
+            self.codes.append(-1)
+            return
+        code = self.index.get(value)
+        if code is None:
+            if len(self.dictionary) >= self.max_size:
+                self.values = self.decode()
+                self.codes = None
+                self.values.append(value)
+                return
+            code = self.index[value] = len(self.dictionary)
+            self.dictionary.append(value)
+        self.codes.append(code)
+
+    def decode(self):
+        """returns list of strings (None for NULL)"""
+        if self.codes is None:
+            return self.values
+        return [self.dictionary[code] if code >= 0 else None for code in self.codes]
+
+    def to_numpy(self):
+        """returns (codes, dictionary) as numpy arrays, dictionary[codes[i]] is the value of row i (-1 = NULL)
+        if the column is not dictionary encoded codes are the row numbers and dictionary the values"""
+        if self.codes is None:
+            return numpy.arange(len(self.values), dtype=numpy.int64), numpy.array(self.values, dtype=object)
+        return numpy.frombuffer(self.codes, dtype=self.codes.typecode), numpy.array(self.dictionary, dtype=object)
+
+    def __len__(self):
+        return len(self.codes) if self.codes is not None else len(self.values)
+
+
+class ObjectColumn:
+    """column of python objects (dates, times, blobs, ...)"""
+
+    def __init__(self):
+        self.values = []
+
+    def append(self, value):
+        self.values.append(value)
+
+    def to_numpy(self):
+        return numpy.array(self.values, dtype=object)
+
+    def __len__(self):
+        return len(self.values)
+
+
+def new_column_buffer(column_info, max_dictionary_size=65536, shared=None):
+    """returns an empty column buffer fitting to a row of information_schema.COLUMNS,
+    decimal/numeric with precision > 15 are stored as Decimal objects, the others as double
+    :param column_info: dictionary with keys DATA_TYPE, COLUMN_TYPE, IS_NULLABLE
+    :param max_dictionary_size: maximal number of distinct strings for dictionary encoding
+    :param shared: previous DictionaryColumn, dictionary is reused so codes are the same over all chunks
+    """
+    data_type = column_info['DATA_TYPE'].lower()
+    nullable = column_info['IS_NULLABLE'] == 'YES'
+    if data_type in ('decimal', 'numeric'):
+        precision = re.search(r"\((\d+)", column_info['COLUMN_TYPE'])
+        if precision and int(precision.group(1)) > MAX_DOUBLE_PRECISION:
+            return ObjectColumn()
+    if data_type in TYPECODES:
+        signed, unsigned, converter = TYPECODES[data_type]
+        typecode = unsigned if 'unsigned' in column_info['COLUMN_TYPE'].lower() else signed
+        return NumericColumn(typecode, converter, nullable)
+    if data_type in STRING_TYPES:
+        if shared is None:
+            return DictionaryColumn(max_dictionary_size)
+        column = DictionaryColumn(max_dictionary_size, shared.dictionary, shared.index)
+        if shared.codes is None:  # dictionary encoding already given up in a previous chunk
+            column.codes, column.values = None, []
+        return column
+    return ObjectColumn()
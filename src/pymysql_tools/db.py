@@ -8,21 +8,54 @@ the order of the arguments in this library should follow the pattern
 methode_name_seperated_by_(cursor,table,column,other_arguments)"""
 
 import re
+import csv
+import contextlib
+import gzip
 import string
 import pymysql
 import pickle
 import datetime
+import hashlib
+import itertools
 import os
+import random
 import sys
+import time
 
 from time import gmtime, strftime
 
+from .cache import AnalyseCache
+from .columns import new_column_buffer
+from .parallel import csv_reader, insert_rows, record_end, load_csv_parallel
+from .inference import TableTypeInference
+
+def normalize_column_type(column_type):
+    """returns (type, not_null) of a column definition like 'INT(11) UNSIGNED NOT NULL' for comparisons,
+    keywords are lower case and whitespace is collapsed, quoted values (ENUM, SET) are kept as they are,
+    display widths of integer types are dropped (PROCEDURE ANALYSE proposes 'INT', 5.7 describes it as 'int(11)')"""
+    parts = re.split("('(?:[^']|'')*')", column_type.strip())
+    normalized = "".join([x if x.startswith("'") else
+                          re.sub(r"\b(tinyint|smallint|mediumint|int|integer|bigint)\s*\(\d+\)", r"\1",
+                                 re.sub(r"\s*,\s*", ",", re.sub(r"\s+", " ", x.lower())))
+                          for x in parts])
+    not_null = normalized.endswith(' not null')
+    return re.sub(" (not )?null$", "", normalized), not_null
+
+
+# storage engines with transactions (and row locks), needed for atomic archive and delete
+TRANSACTIONAL_ENGINES = ('innodb', 'ndbcluster', 'ndb')
+
+
 class MySQLTools:
 
     def __init__(self, *args, **kwargs):
+        # kept to open further connections with the same parameters (e.g. parallel loading)
+        self.connect_args = args
+        self.connect_kwargs = kwargs
         self.conn = pymysql.Connection(*args, **kwargs)
         self.cursor = self.conn.cursor()
         self.cursor_dict = self.conn.cursor(pymysql.cursors.DictCursor)
+        self.last_ddl_report = None
 
     def update_empty_string_to_null(self, table, columns=[]):
         """updates empty string to NULL (if allowed) for all columns (default=[]=>all columns in table)
@@ -50,6 +83,104 @@ class MySQLTools:
         self.cursor.execute("SELECT SUBSTRING_INDEX(USER(),'@',1)")
         return self.cursor.fetchone()[0]
 
+    def get_metadata_lock_blockers(self, table, database=None, min_seconds=60):
+        """returns list of dictionaries describing sessions which could block DDL on table
+        1. performance_schema.metadata_locks (locks on the table held by other sessions) if the instrument
+           wait/lock/metadata/sql/mdl is enabled (default since MySQL 8.0, off in 5.7)
+        2. transactions of other sessions with InnoDB locks on the table (performance_schema.data_locks, 8.0)
+        3. transactions of other sessions open for more than min_seconds (information_schema.INNODB_TRX),
+           the table a transaction uses is not known here
+        :param table: table name
+        :type table: str
+        :param database: database name (default connected database)
+        :type database: str
+        :param min_seconds: minimal duration of open transactions counted as blockers in 3.
+        :type min_seconds: int
+        """
+        if not database:
+            database = self.get_database_name()
+        if self.__metadata_lock_instrument_enabled():
+            self.cursor_dict.execute("""SELECT t.PROCESSLIST_ID AS thread_id, ml.LOCK_TYPE AS lock_type,
+                    ml.LOCK_STATUS AS lock_status, t.PROCESSLIST_TIME AS seconds, t.PROCESSLIST_INFO AS query
+                FROM performance_schema.metadata_locks ml
+                JOIN performance_schema.threads t ON t.THREAD_ID = ml.OWNER_THREAD_ID
+                WHERE ml.OBJECT_SCHEMA = %s AND ml.OBJECT_NAME = %s
+                  AND ml.LOCK_STATUS = 'GRANTED' AND t.PROCESSLIST_ID <> CONNECTION_ID()""",
+                                     (database, table))
+            return list(self.cursor_dict.fetchall())
+        try:
+            self.cursor_dict.execute("""SELECT DISTINCT trx.trx_mysql_thread_id AS thread_id, dl.LOCK_TYPE AS lock_type,
+                    trx.trx_state AS lock_status, TIMESTAMPDIFF(SECOND, trx.trx_started, NOW()) AS seconds,
+                    trx.trx_query AS query
+                FROM performance_schema.data_locks dl
+                JOIN information_schema.INNODB_TRX trx ON trx.trx_id = dl.ENGINE_TRANSACTION_ID
+                WHERE dl.OBJECT_SCHEMA = %s AND dl.OBJECT_NAME = %s
+                  AND trx.trx_mysql_thread_id <> CONNECTION_ID()""", (database, table))
+            return list(self.cursor_dict.fetchall())
+        except pymysql.MySQLError:
+            pass
+        try:
+            self.cursor_dict.execute("""SELECT trx_mysql_thread_id AS thread_id, trx_state AS lock_status,
+                    TIMESTAMPDIFF(SECOND, trx_started, NOW()) AS seconds, trx_query AS query
+                FROM information_schema.INNODB_TRX
+                WHERE trx_mysql_thread_id <> CONNECTION_ID()
+                  AND trx_started < NOW() - INTERVAL %s SECOND""", (min_seconds,))
+            return list(self.cursor_dict.fetchall())
+        except pymysql.MySQLError:
+            return []
+
+    def __metadata_lock_instrument_enabled(self):
+        """True if performance_schema records metadata locks"""
+        try:
+            self.cursor.execute("""SELECT ENABLED FROM performance_schema.setup_instruments
+                WHERE NAME = 'wait/lock/metadata/sql/mdl'""")
+            row = self.cursor.fetchone()
+        except pymysql.MySQLError:
+            return False
+        return bool(row) and row[0] == 'YES'
+
+    def execute_ddl(self, sql, table=None, lock_wait_timeout=5, retries=5, backoff=1.0):
+        """executes DDL with a short session lock_wait_timeout, so a blocked ALTER never queues all other
+        queries on the table behind it for long. If other sessions hold metadata locks on table or the
+        lock wait timeout is exceeded the statement is retried with exponential backoff and jitter.
+        A report is stored in self.last_ddl_report {'sql', 'attempts', 'seconds', 'blockers': [...]}
+
+        :param sql: DDL statement
+        :type sql: str
+        :param table: table name to check for blockers (default no check before execution)
+        :type table: str
+        :param lock_wait_timeout: session lock_wait_timeout in seconds during execution
+        :type lock_wait_timeout: int
+        :param retries: number of retries
+        :type retries: int
+        :param backoff: seconds to wait before the first retry, doubled for every further retry
+        :type backoff: float
+        @return: return value of cursor.execute
+        """
+        report = {'sql': sql, 'attempts': 0, 'seconds': 0.0, 'blockers': []}
+        self.last_ddl_report = report
+        start = time.time()
+        self.cursor.execute("SELECT @@SESSION.lock_wait_timeout")
+        old_lock_wait_timeout = self.cursor.fetchone()[0]
+        self.cursor.execute("SET SESSION lock_wait_timeout = %d" % lock_wait_timeout)
+        try:
+            for attempt in range(retries + 1):
+                report['attempts'] = attempt + 1
+                blockers = self.get_metadata_lock_blockers(table) if table else []
+                report['blockers'] += blockers
+                if not blockers or attempt == retries:
+                    try:
+                        return self.cursor.execute(sql)
+                    except pymysql.err.OperationalError as e:
+                        if e.args[0] != 1205 or attempt == retries:  # 1205: lock wait timeout exceeded
+                            raise
+                print("DDL on `%s` blocked by %d session(s), retry %d/%d: %s" % (
+                    table, len(blockers), attempt + 1, retries, sql))
+                time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        finally:
+            report['seconds'] = time.time() - start
+            self.cursor.execute("SET SESSION lock_wait_timeout = %d" % old_lock_wait_timeout)
+
     def get_columns_with_null(self, table):
         """get all column names with NULL
         :param table: table name
@@ -65,7 +196,7 @@ class MySQLTools:
         :param new_table_name: new table name
         :type new_table_name: str
         """
-        return self.cursor.execute("rename table `%s` to `%s`" % (old_table_name, new_table_name))
+        return self.execute_ddl("rename table `%s` to `%s`" % (old_table_name, new_table_name), old_table_name)
 
     def trim_all(self, table, columns=[]):
         """
@@ -88,16 +219,16 @@ class MySQLTools:
         :type columns: iterable o str or str
         """
         columns_changed = []
-        columns = self.__get_columns(self.cursor, table, columns)
+        columns = self.__get_columns(table, columns)
         for column in columns:
             if not self.cursor.execute("SELECT * from `%s` where `%s` IS NULL" % (table, column)):
-                col_info = self.get_column_information_schema(self.cursor, table, column)
+                col_info = self.get_column_information_schema(table, column)
                 char_set_name = col_info['CHARACTER_SET_NAME']
                 character_set = " CHARACTER SET " + char_set_name if char_set_name else ''
                 coll_name = col_info['COLLATION_NAME']
                 collate = " COLLATE " + coll_name if coll_name else ''
-                self.cursor.execute("ALTER TABLE `%s` CHANGE `%s` `%s` %s %s %s NOT NULL"
-                                    % (table, column, column, col_info['COLUMN_TYPE'], character_set, collate))
+                self.execute_ddl("ALTER TABLE `%s` CHANGE `%s` `%s` %s %s %s NOT NULL"
+                                 % (table, column, column, col_info['COLUMN_TYPE'], character_set, collate), table)
         return columns_changed
 
     def __get_columns(self, table, columns):
@@ -121,8 +252,8 @@ class MySQLTools:
         :param name_of_column: name of promary key column
         :type name_of_column: str
         """
-        self.cursor.execute("ALTER TABLE %s ADD COLUMN %s INT NOT NULL AUTO_INCREMENT FIRST, ADD primary KEY id(%s)"
-                            % (table, name_of_column, name_of_column))
+        self.execute_ddl("ALTER TABLE %s ADD COLUMN %s INT NOT NULL AUTO_INCREMENT FIRST, ADD primary KEY id(%s)"
+                         % (table, name_of_column, name_of_column), table)
 
     def use_database(self, database):
         """change database
@@ -158,7 +289,7 @@ class MySQLTools:
             if index.lower() != 'primary':  # not drop primary key
                 index_list.add(index)
         for index in index_list:
-            self.cursor.execute("DROP INDEX %s ON %s.%s " % (index, database, table))
+            self.execute_ddl("DROP INDEX %s ON %s.%s " % (index, database, table), table)
 
     def drop_create_database(self, database):
         """Drops the database dbname if exists, creates a new database dbname and finally 
@@ -170,8 +301,8 @@ class MySQLTools:
     def add_column(self, table, column, column_description):
         """add column(s) to table. Schema of columns for one e.g..: ('column_name','int(10) NOT NULL') for multiple (('cn1','col_desc'),('cn1','col_desc'),...)'"""
         # TODO: fix this methode
-        if column not in self.get_column_names(cursor, table):
-            self.cursor.execute("ALTER TABLE `%s` ADD `%s` %s" % (table, column, column_description))
+        if column not in self.get_column_names(table):
+            self.execute_ddl("ALTER TABLE `%s` ADD `%s` %s" % (table, column, column_description), table)
         else:
             print("column `%s` in table `%s` already exists" % (column, table))
             return 0
@@ -185,10 +316,10 @@ class MySQLTools:
         field_keys = [(x[0], x[3]) for x in self.cursor.fetchall()]
         if (index_name, 'UNI') not in field_keys:
             if len(over_columns):
-                self.cursor.execute("alter table `" + table + "` add unique " + index_name + " (" + (
-                ",".join(["`" + x + "`" for x in over_columns])) + ")")
+                self.execute_ddl("alter table `" + table + "` add unique " + index_name + " (" + (
+                ",".join(["`" + x + "`" for x in over_columns])) + ")", table)
             else:
-                self.cursor.execute("ALTER TABLE `" + table + "` ADD UNIQUE (`" + index_name + "`)")
+                self.execute_ddl("ALTER TABLE `" + table + "` ADD UNIQUE (`" + index_name + "`)", table)
             return True
         else:
             return False
@@ -209,11 +340,11 @@ class MySQLTools:
                     continue
                 else:
                     if Type not in ["text", "longtext"]:
-                        self.cursor.execute("ALTER TABLE " + table + " ADD INDEX ( `" + column + "` )")
+                        self.execute_ddl("ALTER TABLE " + table + " ADD INDEX ( `" + column + "` )", table)
                     else:
                         try:
                             sql = "ALTER TABLE " + table + " ADD FULLTEXT (`" + column + "`)"
-                            self.cursor.execute(sql)
+                            self.execute_ddl(sql, table)
                         except:
                             print("Not possible to execute following SQL:", sql)
             else:
@@ -230,7 +361,7 @@ class MySQLTools:
                     try:
                         print("Create index on " + table + "." + Field)
                         sql = "ALTER TABLE `" + table + "` ADD INDEX (`" + Field + "`)"
-                        self.cursor.execute(sql)
+                        self.execute_ddl(sql, table)
                     except:
                         print("Not possible to execute following SQL:", sql)
 
@@ -254,10 +385,10 @@ class MySQLTools:
                 print("\tmake table " + table + " unique")
                 self.cursor.execute("show create table `%s`" % table)
                 create_table = self.cursor.fetchone()[1]
-                self.cursor.execute("Alter table `%s` rename `temp_%s`" % (table, table))
+                self.execute_ddl("Alter table `%s` rename `temp_%s`" % (table, table), table)
                 self.cursor.execute(create_table)
                 self.cursor.execute("insert into `%s` SELECT distinct * from `temp_%s`" % (table, table))
-                self.cursor.execute("Drop table `temp_%s`" % table)
+                self.execute_ddl("Drop table `temp_%s`" % table, "temp_" + table)
             else:
                 print("table %s already unique" % table)
 
@@ -266,7 +397,7 @@ class MySQLTools:
         if type(column_list) == str:
             column_list = [column_list]
         for column in column_list:
-            self.cursor.execute("ALTER TABLE `%s` DROP `%s`" % (table, column))
+            self.execute_ddl("ALTER TABLE `%s` DROP `%s`" % (table, column), table)
 
     def column_exists(self, table, column):
         return self.table_exists(table) and self.cursor.execute("show columns from `%s` like '%s'" % (table, column))
@@ -288,21 +419,67 @@ class MySQLTools:
         @return: True if remove else False
         """
         if self.table_exists(table):
-            self.cursor.execute("drop table `%s`" % table)
+            self.execute_ddl("drop table `%s`" % table, table)
             removed = True
         else:
             removed = False
         return removed
 
-    def analyse_table(self, table, database=None, **params):
+    def get_table_change_marker(self, table, database=None):
+        """returns a marker which changes if data or structure of the table changes, None if not determinable
+        MyISAM: (engine, CHECKSUM TABLE, schema fingerprint)
+        InnoDB and others: (engine, UPDATE_TIME, TABLE_ROWS, schema fingerprint)
+        UPDATE_TIME of InnoDB is not persistent (NULL after a server restart), in this case None is returned
+        :param table: table name
+        :type table: str
+        :param database: database name (default connected database)
+        :type database: str
+        """
+        if not database:
+            database = self.get_database_name()
+        self.cursor.execute("""SELECT ENGINE, UPDATE_TIME, TABLE_ROWS
+            FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA='%s' AND TABLE_NAME='%s'""" % (database, table))
+        row = self.cursor.fetchone()
+        if not row:
+            return None
+        engine, update_time, table_rows = row
+        self.cursor.execute("""SELECT COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA='%s' AND TABLE_NAME='%s'
+            ORDER BY ORDINAL_POSITION""" % (database, table))
+        fingerprint = hashlib.md5(repr(self.cursor.fetchall()).encode('utf-8')).hexdigest()
+        if engine and engine.lower() == 'myisam':
+            self.cursor.execute("CHECKSUM TABLE `%s`.`%s`" % (database, table))
+            checksum = self.cursor.fetchone()[1]
+            return (engine, checksum, fingerprint) if checksum is not None else None
+        if update_time is None:
+            return None
+        return (engine, str(update_time), table_rows, fingerprint)
+
+    def __analyse_cache_key(self, table, database, **params):
+        """key of a table analysis in AnalyseCache"""
+        enums = tuple(sorted(params['enums'])) if 'enums' in params else None
+        return (self.get_hostname(), database, table, enums)
+
+    def analyse_table(self, table, database=None, cache=None, force=False, **params):
         """analyse table and returns dict with columns names as keys and values is dictionary with following keys Field_name,Min_value,Max_value,Min_length,Max_length,Empties_or_zeros,Nulls,Avg_value_or_avg_length,Std,Optimal_fieldtype
         :param table: Table name
         :param columns: Column name (string,list or tuple of strings)
         :param cursor: pymysql cursor  
+        :param cache: AnalyseCache; if the change marker of the table is unchanged the cached analysis is returned
+        :param force: if True table is analysed even if a valid cache entry exists
         :param params: parameter set {'enums':['list','of','enum','column','names'],...}
         """
         if not database:
             database = self.get_database_name()
+        if cache is not None:
+            cache_key = self.__analyse_cache_key(table, database, **params)
+            marker = self.get_table_change_marker(table, database)
+            if not force:
+                cached_analysis = cache.get(cache_key, marker)
+                if cached_analysis is not None:
+                    return cached_analysis
         columns = ['Min_value', 'Max_value', 'Min_length', 'Max_length', 'Empties_or_zeros', 'Nulls',
                    'Avg_value_or_avg_length', 'Std', 'Optimal_fieldtype']
         self.cursor.execute("SELECT * FROM `%s`.`%s` PROCEDURE ANALYSE ()" % (database, table))
@@ -352,6 +529,10 @@ class MySQLTools:
             if add_to_analyse_dict:
                 analyse_dict[column] = adict
 
+        if cache is not None:
+            cache.set(cache_key, marker, analyse_dict)
+            cache.save()
+
         return analyse_dict
 
     def drop_indices(self, dbcursor, tables=[], delete_primary_unique=0):
@@ -370,13 +551,153 @@ class MySQLTools:
                                 r[0] not in deleted_indices and r[5] != "auto_increment":
                     sql = "ALTER TABLE `%s` DROP INDEX `%s`" % (table, r[0])
                     try:
-                        dbcursor.execute(sql)
+                        self.execute_ddl(sql, table)
                     except:
                         print(__file__, "\nCan't execute following SQL:\n", sql)
                     deleted_indices += [r[0]]
                     droped_indices += [r]
         return droped_indices
 
+    def get_index_definitions(self, table, secondary_only=True):
+        """returns the index definitions of a table from SHOW INDEX as list of dictionaries
+        {'name': index name, 'unique': bool, 'type': 'BTREE'|'HASH'|'FULLTEXT'|'SPATIAL',
+        'comment': index comment, 'visible': bool,
+        'columns': [(column or None, sub_part or None, 'DESC' or '', expression or None),...]}
+        functional key parts (MySQL >= 8.0.13) have no column but an expression
+        :param table: table name
+        :type table: str
+        :param secondary_only: True = without PRIMARY key and without indices needed by foreign keys
+        :type secondary_only: bool
+        """
+        self.cursor_dict.execute("SHOW INDEX FROM `%s`" % table)
+        indices = {}
+        for r in self.cursor_dict.fetchall():
+            index = indices.setdefault(r['Key_name'], {'name': r['Key_name'], 'unique': not int(r['Non_unique']),
+                                                       'type': r['Index_type'],
+                                                       'comment': r.get('Index_comment') or '',
+                                                       'visible': r.get('Visible', 'YES') != 'NO', 'columns': []})
+            index['columns'].append((r['Column_name'], r['Sub_part'], 'DESC' if r.get('Collation') == 'D' else '',
+                                     r.get('Expression')))
+        indices = list(indices.values())
+        if secondary_only:
+            self.cursor.execute("""SELECT CONSTRAINT_NAME, COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE
+                WHERE TABLE_SCHEMA='%s' AND TABLE_NAME='%s' AND REFERENCED_TABLE_NAME IS NOT NULL
+                ORDER BY CONSTRAINT_NAME, ORDINAL_POSITION""" % (self.get_database_name(), table))
+            foreign_keys = {}
+            for constraint, column in self.cursor.fetchall():
+                foreign_keys.setdefault(constraint, []).append(column)
+
+            def needed_by_foreign_key(index):
+                columns = [x[0] for x in index['columns']]
+                return any(columns[:len(x)] == x for x in foreign_keys.values())
+
+            indices = [x for x in indices if x['name'] != 'PRIMARY' and not needed_by_foreign_key(x)]
+        return indices
+
+    @staticmethod
+    def index_definition_sql(index):
+        """returns the ADD clause of ALTER TABLE for an index definition of get_index_definitions
+        raises ValueError if a key part has neither column nor expression"""
+        key_parts = []
+        for column, sub_part, order, expression in index['columns']:
+            if column:
+                key_part = "`%s`%s" % (column, "(%d)" % int(sub_part) if sub_part else '')
+            elif expression:
+                key_part = "(%s)" % expression
+            else:
+                raise ValueError("index `%s` has a key part without column and expression" % index['name'])
+            key_parts.append(key_part + (" " + order if order else ''))
+        if index['type'] in ('FULLTEXT', 'SPATIAL'):
+            sql = "ADD %s INDEX `%s` (%s)" % (index['type'], index['name'], ", ".join(key_parts))
+        else:
+            sql = "ADD %sINDEX `%s` (%s)" % ("UNIQUE " if index['unique'] else '', index['name'], ", ".join(key_parts))
+            if index['type'] in ('BTREE', 'HASH'):
+                sql += " USING " + index['type']
+        if index.get('comment'):
+            sql += " COMMENT '%s'" % index['comment'].replace("\\", "\\\\").replace("'", "''")
+        if not index.get('visible', True):
+            sql += " INVISIBLE"
+        return sql
+
+    @contextlib.contextmanager
+    def bulk_load_mode(self, tables, keep_unique=False):
+        """context manager for bulk loads: drops all secondary indices (also UNIQUE and FULLTEXT, not PRIMARY and
+        indices needed by foreign keys) of the tables and disables unique_checks and foreign_key_checks of the
+        session. On exit (also after an exception) the indices are rebuilt and the session variables are
+        restored. All BTREE/HASH indices of a table are rebuilt with one ALTER TABLE, every FULLTEXT and SPATIAL
+        index with its own (InnoDB creates only one FULLTEXT index at a time). If an ALTER fails its indices are
+        rebuilt one by one, so only the indices which really can't be rebuilt (e.g. UNIQUE with duplicates) are
+        lost; they are reported by name in the raised ValueError. Not existing tables and indices which can't be
+        recreated by index_definition_sql are ignored.
+        Without keep_unique UNIQUE keys don't exist inside the block: INSERT IGNORE, REPLACE and
+        INSERT ... ON DUPLICATE KEY UPDATE (e.g. the upserts of sync_table) insert duplicates there and the UNIQUE
+        index can't be rebuilt afterwards. keep_unique=True keeps UNIQUE indices and unique_checks.
+        The session variables only apply to this connection, not to other connections like the
+        workers of csv2db_from_file(workers > 1). csv2db_from_file creates a new table without indices, so
+        there is nothing to defer; use this for loads into existing tables.
+        with pt.bulk_load_mode(['table1', 'table2']):
+            pt.cursor.executemany("INSERT INTO `table1` VALUES (%s, %s)", rows)
+            pt.conn.commit()
+        :param tables: table name(s)
+        :type tables: iterable of str or str
+        :param keep_unique: True = UNIQUE indices are not dropped and unique_checks stays enabled
+        :type keep_unique: bool
+        @return: dictionary {table: dropped index definitions,...}
+        """
+        if type(tables) == str:
+            tables = [tables]
+        dropped = {}
+        self.cursor.execute("SELECT @@SESSION.unique_checks, @@SESSION.foreign_key_checks")
+        unique_checks, foreign_key_checks = self.cursor.fetchone()
+        self.cursor.execute("SET SESSION unique_checks = %d, foreign_key_checks = 0"
+                            % (unique_checks if keep_unique else 0))
+        try:
+            for table in tables:
+                if not self.table_exists(table):
+                    continue
+                indices = []
+                for index in self.get_index_definitions(table):
+                    if keep_unique and index['unique']:
+                        continue
+                    try:
+                        self.index_definition_sql(index)
+                        indices.append(index)
+                    except ValueError as e:
+                        print("index is kept: %s" % e)
+                if indices:
+                    self.execute_ddl("ALTER TABLE `%s` %s" % (
+                        table, ", ".join(["DROP INDEX `%s`" % x['name'] for x in indices])), table)
+                    dropped[table] = indices
+            yield dropped
+        finally:
+            lost = []
+            for table, indices in dropped.items():
+                lost += ["`%s`.`%s` (%s)" % (table, name, e) for name, e in self.__rebuild_indices(table, indices)]
+            self.cursor.execute("SET SESSION unique_checks = %d, foreign_key_checks = %d"
+                                % (unique_checks, foreign_key_checks))
+            if lost:
+                raise ValueError("indices could not be rebuilt: " + ", ".join(lost))
+
+    def __rebuild_indices(self, table, indices):
+        """adds indices (definitions of get_index_definitions) to table, BTREE/HASH indices in one ALTER TABLE,
+        FULLTEXT/SPATIAL indices each in its own; the indices of a failed ALTER are retried one by one
+        returns [(name of index which can't be rebuilt, exception),...]"""
+        groups = [[x for x in indices if x['type'] not in ('FULLTEXT', 'SPATIAL')]]
+        groups += [[x] for x in indices if x['type'] in ('FULLTEXT', 'SPATIAL')]
+        failed = []
+        for group in [x for x in groups if x]:
+            sql = "ALTER TABLE `%s` %s" % (table, ", ".join([self.index_definition_sql(x) for x in group]))
+            try:
+                self.execute_ddl(sql, table)
+            except Exception as e:
+                print("Can't rebuild indices of `%s`:\n%s\n%s" % (table, sql, e))
+                if len(group) == 1:
+                    failed.append((group[0]['name'], e))
+                else:
+                    for index in group:
+                        failed += self.__rebuild_indices(table, [index])
+        return failed
+
     def compare_database_structures(self, dbcursor1, dbcursor2, tablePrefix1='', tablePrefix2=''):
         """Compare the structure of two databases"""
         dbcursor1.execute("SELECT database()")
@@ -575,12 +896,19 @@ class MySQLTools:
         :param cursor: pymysql cursor
         :param tables: list of strings or string (table names or only one table name)
         :param params: parameter set {'enums':['list','of','enum','column','names'],...}  
+                       cache = AnalyseCache or path to cache file, unchanged tables are not analysed again
+                       force = True analyse all tables even if cached (default False)
         @return: optimizedColumnTypes [(column, optimized_type),...]
         optimize if table is not null
         NOT optimize: column is auto incremental
         Keep NULL attribute: column is designed to be NULL, not optimize to NOT NULL       
         """
         optimizedColumnTypes = []
+        cache = params.get('cache')
+        if isinstance(cache, str):
+            cache = AnalyseCache(cache)
+        force = params.get('force', False)
+        analyse_params = {'enums': params['enums']} if 'enums' in params else {}
         if type(tables) == str:
             tables = [tables]
         if len(tables) == 0:
@@ -594,22 +922,31 @@ class MySQLTools:
             for column in self.cursor.fetchall():
                 column_name = column[0]
                 column_type = column[1]
-                original_columns_dict[column_name] = column_type
-            if 'enums' in params:
-                analysis = self.analyse_table(table, enums=params['enums'])
-            else:
-                analysis = self.analyse_table(table)
+                original_columns_dict[column_name] = (column_type, column[2])
+            analysis = self.analyse_table(table, cache=cache, force=force, **analyse_params)
+            altered = False
             for column in analysis.keys():
                 if self.get_column_information_schema(table, column)['EXTRA'] == '':
                     optimized_type = analysis[column]['Optimal_fieldtype']
                     sql = "ALTER TABLE `%s` CHANGE `%s` `%s` %s;" % (table, column, column, optimized_type)
+                    original_type, original_null = original_columns_dict[column]
+                    if normalize_column_type(optimized_type) == \
+                            normalize_column_type(original_type + (' NOT NULL' if original_null == 'NO' else '')):
+                        continue  # column has already the optimal type, avoid a table rebuild
                     optimizedColumnTypes += [(column, optimized_type)]
                     if execute == True:
                         try:
-                            self.cursor.execute(sql)
+                            self.execute_ddl(sql, table)
+                            altered = True
                         except:
                             print("error when execute %s" % (sql))
                             sys.exit()
+            if altered and cache is not None:
+                # the ALTERs changed the change marker, the analysis is still valid for the optimized table
+                database = self.get_database_name()
+                cache.set(self.__analyse_cache_key(table, database, **analyse_params),
+                          self.get_table_change_marker(table, database), analysis)
+                cache.save()
         return optimizedColumnTypes
 
     def get_view_names(self):
@@ -651,6 +988,74 @@ class MySQLTools:
                             % (table, column, database))
         return self.cursor.fetchone()[0]
 
+    def fetch_columns(self, table, columns, where=None, chunk_rows=None, as_numpy=False, max_dictionary_size=65536):
+        """Fetches columns of a table into array backed column buffers (see pymysql_tools.columns) instead of
+        one python object per cell. Rows are streamed with a server side cursor, the data type of each buffer
+        is derived from information_schema.COLUMNS. Strings are dictionary encoded until more than
+        max_dictionary_size distinct values are found. decimal/numeric columns with up to 15 digits are stored as
+        double, with more digits as decimal.Decimal objects (a double would silently lose precision).
+        While a generator (chunk_rows given) is not exhausted no other query can be executed on this connection.
+
+        :param table: table name
+        :type table: str
+        :param columns: column name(s)
+        :type columns: iterable of str or str
+        :param where: SQL condition (optional)
+        :type where: str
+        :param chunk_rows: None = returns all rows at once, else returns generator of chunks with chunk_rows rows
+        :type chunk_rows: int
+        :param as_numpy: True = values are numpy arrays (masked array for nullable numeric columns,
+                         tuple (codes, dictionary) for string columns)
+        :type as_numpy: bool
+        @return: dictionary {column: column buffer or numpy array,...} or generator of such dictionaries
+        """
+        chunks = self.__iter_column_chunks(table, columns, where, chunk_rows, as_numpy, max_dictionary_size)
+        if chunk_rows:
+            return chunks
+        column_buffers = next(chunks)
+        chunks.close()
+        return column_buffers
+
+    def __iter_column_chunks(self, table, columns, where, chunk_rows, as_numpy, max_dictionary_size):
+        """generator of column chunks for fetch_columns (chunk_rows=None => one chunk with all rows)"""
+        columns = self.__get_columns(table, columns)
+        self.cursor_dict.execute("""SELECT COLUMN_NAME, DATA_TYPE, COLUMN_TYPE, IS_NULLABLE
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA='%s' AND TABLE_NAME='%s'""" % (self.get_database_name(), table))
+        column_infos = dict((x['COLUMN_NAME'], x) for x in self.cursor_dict.fetchall())
+
+        def new_buffers(previous=None):
+            return [new_column_buffer(column_infos[column], max_dictionary_size,
+                                      previous[i] if previous else None) for i, column in enumerate(columns)]
+
+        def result(buffers):
+            if as_numpy:
+                return dict((column, buffers[i].to_numpy()) for i, column in enumerate(columns))
+            return dict(zip(columns, buffers))
+
+        sql = "SELECT %s FROM `%s`" % (", ".join(["`" + x + "`" for x in columns]), table)
+        if where:
+            sql += " WHERE " + where
+        ss_cursor = self.conn.cursor(pymysql.cursors.SSCursor)
+        try:
+            ss_cursor.execute(sql)
+            buffers = new_buffers()
+            fetch_size = chunk_rows or 10000
+            while True:
+                rows = ss_cursor.fetchmany(fetch_size)
+                for row in rows:
+                    for i, value in enumerate(row):
+                        buffers[i].append(value)
+                if chunk_rows and (len(buffers[0]) >= chunk_rows or not rows) and len(buffers[0]):
+                    yield result(buffers)
+                    buffers = new_buffers(buffers)
+                if not rows:
+                    break
+            if not chunk_rows:
+                yield result(buffers)
+        finally:
+            ss_cursor.close()
+
     def fit4sql(self, obj, not_null=False):
         """fit strings for SQL statments"""
         if type(obj) == str:
@@ -678,40 +1083,244 @@ class MySQLTools:
                              field_enclosed_by = charater enclose fields
                              first_line_columns = True or False; default == False
                              database = use this database (default connected database)  
+                             encoding = encoding of the file; default == utf-8
+                             batch_rows = number of rows per INSERT; default == 1000
+                             workers = number of processes loading the file in parallel, each with its own
+                                       connection; default == 1
+                             staging = True: every worker loads into its own staging table, merged at the end
+                                       (the table is MyISAM, which allows only one writer per table);
+                                       default == True if workers > 1
+                             infer_types = True: columns are created with compact types (int, decimal, date,
+                                           datetime, enum, varchar) inferred from the values instead of
+                                           text NOT NULL, empty values in not string columns become NULL,
+                                           varchar columns beyond the row size limit become text;
+                                           default == False
+                             infer_rows = None: types are inferred in a first pass over the complete file;
+                                          n: types are inferred from the first n rows and widened with
+                                          ALTER TABLE if later rows don't fit (ignored with workers > 1);
+                                          default == None
+                             enum_max = maximal number of distinct values for ENUM columns; default == 16
+        @return: number of loaded rows
         """
-        if not parameters.has_key('database'):
-            parameters['database'] = self.database
-        if not parameters.has_key('table_name'):
-            parameters['table_name'] = os.path.split(path_to_csv_file)
-        if not parameters.has_key('first_line_columns'):
-            parameters['first_line_columns'] = False
-        if not parameters.has_key('delimiter'):
-            parameters['delimiter'] = "\t"
-        first_line = True
-        for line in open(path_to_csv_file):
-            line = line.strip()
-            if first_line:
-                if parameters.has_key('columns'):
-                    cols = parameters['columns']
-                elif parameters['first_line_columns']:
-                    cols = line.split(parameters['delimiter'])
-                else:
-                    cols = ["column_" + str(x) for x in range(len(line.split(parameters['delimiter'])))]
-                len_cols = len(cols)
-                colsSql = ", ".join(["`" + x + "` text NOT NULL" for x in cols])
-                self.cursor.execute("CREATE TABLE `%s` (%s) TYPE=MyISAM" % (parameters['table_name'], colsSql))
-                first_line = False
-                if parameters['first_line_columns']:
-                    continue
-            value_list = [self.fit(x) for x in line.split(parameters['delimiter'])]
-            insert_columns = (", ".join(value_list)) + (",''" * (len_cols - len(value_list)))
-            self.cursor.execute("Insert into `%s` values(%s)" % (parameters['table_name'], insert_columns))
+        if 'database' in parameters:
+            self.use_database(parameters['database'])
+        if 'table_name' not in parameters:
+            parameters['table_name'] = os.path.splitext(os.path.basename(path_to_csv_file))[0]
+        parameters.setdefault('first_line_columns', False)
+        parameters.setdefault('delimiter', "\t")
+        parameters.setdefault('field_enclosed_by', None)
+        parameters.setdefault('encoding', 'utf-8')
+        parameters.setdefault('batch_rows', 1000)
+        parameters.setdefault('workers', 1)
+        parameters.setdefault('staging', parameters['workers'] > 1)
+        parameters.setdefault('infer_types', False)
+        parameters.setdefault('infer_rows', None)
+        parameters.setdefault('enum_max', 16)
+        table = parameters['table_name']
+
+        with open(path_to_csv_file, newline='', encoding=parameters['encoding']) as fd:
+            first_row = next(csv_reader(fd, parameters['delimiter'], parameters['field_enclosed_by']), [])
+        if 'columns' in parameters:
+            cols = parameters['columns']
+        elif parameters['first_line_columns']:
+            cols = [x.strip() for x in first_row]
+        else:
+            cols = ["column_" + str(x) for x in range(len(first_row))]
+
+        rows = self.__iter_csv_rows(path_to_csv_file, parameters)
+        sample = []
+        inference = None
+        sample_mode = parameters['infer_types'] and parameters['infer_rows'] is not None \
+            and parameters['workers'] <= 1
+        if parameters['infer_types']:
+            # varchar columns count with their maximal bytes in the row size limit of the table
+            self.cursor.execute("""SELECT MAXLEN FROM information_schema.CHARACTER_SETS
+                WHERE CHARACTER_SET_NAME = @@character_set_database""")
+            max_bytes_per_char = (self.cursor.fetchone() or (4,))[0]
+            inference = TableTypeInference(len(cols), parameters['enum_max'], max_bytes_per_char)
+            if sample_mode:
+                sample = list(itertools.islice(rows, parameters['infer_rows']))
+                for row in sample:
+                    inference.add(row)
+                inference.freeze_enums()
+            else:
+                for row in self.__iter_csv_rows(path_to_csv_file, parameters):
+                    inference.add(row)
+            col_types = inference.sql_types()
+        else:
+            col_types = ["text NOT NULL"] * len(cols)
+        parameters['empty_to_null'] = inference.empty_to_null() if inference else set()
+        colsSql = ", ".join(["`%s` %s" % (x, col_type) for x, col_type in zip(cols, col_types)])
+        self.cursor.execute("CREATE TABLE `%s` (%s) ENGINE=MyISAM" % (table, colsSql))
+
+        if parameters['workers'] > 1:
+            rows.close()
+            start = record_end(path_to_csv_file, 1, parameters['field_enclosed_by'],
+                               delimiter=parameters['delimiter']) if parameters['first_line_columns'] else 0
+            return load_csv_parallel(self, path_to_csv_file, start, table, len(cols), parameters)
+
+        loaded, batch = 0, []
+        for i, row in enumerate(itertools.chain(sample, rows)):
+            if sample_mode and i >= len(sample):
+                inference.add(row)
+            batch.append(row)
+            if len(batch) >= parameters['batch_rows']:
+                if sample_mode:
+                    col_types = self.__widen_columns(table, cols, col_types, inference, parameters)
+                loaded += insert_rows(self.cursor, table, len(cols), batch, parameters['empty_to_null'])
+                self.conn.commit()
+                batch = []
+        if batch:
+            if sample_mode:
+                col_types = self.__widen_columns(table, cols, col_types, inference, parameters)
+            loaded += insert_rows(self.cursor, table, len(cols), batch, parameters['empty_to_null'])
+            self.conn.commit()
+        return loaded
+
+    def __iter_csv_rows(self, path_to_csv_file, parameters):
+        """yields the parsed data rows (without header) of a CSV file for csv2db_from_file"""
+        with open(path_to_csv_file, newline='', encoding=parameters['encoding']) as fd:
+            reader = csv_reader(fd, parameters['delimiter'], parameters['field_enclosed_by'])
+            if parameters['first_line_columns']:
+                next(reader, None)
+            for row in reader:
+                yield row
+
+    def __widen_columns(self, table, cols, col_types, inference, parameters):
+        """alters columns whose inferred type changed by rows after the sample, returns new column types"""
+        new_col_types = inference.sql_types()
+        changes = ["MODIFY `%s` %s" % (col, new_type)
+                   for col, old_type, new_type in zip(cols, col_types, new_col_types) if old_type != new_type]
+        if changes:
+            # string columns becoming numeric or date columns contain '' instead of NULL up to now
+            empty_to_null = inference.empty_to_null()
+            for i in empty_to_null - parameters['empty_to_null']:
+                self.cursor.execute("UPDATE `%s` SET `%s` = NULL WHERE `%s` = ''" % (table, cols[i], cols[i]))
+                self.conn.commit()
+            print("widen columns of `%s`: %s" % (table, ", ".join(changes)))
+            self.execute_ddl("ALTER TABLE `%s` %s" % (table, ", ".join(changes)), table)
+            parameters['empty_to_null'] = empty_to_null
+        return new_col_types
+
+    def archive_rows(self, table, where, dest=None, chunk_rows=1000, sleep=0.0, state_file=None):
+        """Archives and deletes rows matching where in small chunks along the primary key. Every chunk is
+        read with SELECT ... FOR UPDATE, archived and deleted by its keys in one short transaction so the table
+        is never locked for long. Table and archive table must be transactional (InnoDB), MyISAM is refused
+        because archive and delete could not be undone together.
+        Progress is stored in state_file, an interrupted run continues from there when called again.
+
+        :param table: table name (needs a single column primary key)
+        :type table: str
+        :param where: SQL condition of rows to archive, e.g. "created < '2017-01-01'"
+        :type where: str
+        :param dest: None = only delete, path ending with '.gz' = append rows tab separated to gzip file,
+                     else name of archive table (created with structure of table if not exists)
+        :type dest: str
+        :param chunk_rows: number of rows per chunk
+        :type chunk_rows: int
+        :param sleep: seconds to sleep between chunks
+        :type sleep: float
+        :param state_file: file to save progress (default for file dest: dest + '.state')
+        :type state_file: str
+        @return: dictionary {'rows': archived rows, 'chunks': number of chunks, 'seconds': duration,
+                 'rows_per_second': throughput}
+        """
+        primary_key = self.get_primary_key(table)
+        if not primary_key:
+            raise ValueError("table `%s` needs a single column primary key for archive_rows" % table)
+        to_file = dest is not None and dest.endswith('.gz')
+        if to_file and not state_file:
+            state_file = dest + '.state'
+        # checked before dest is created, a refused call leaves no archive table behind
+        dest_exists = dest is not None and not to_file and self.table_exists(dest)
+        for checked_table in [table] + ([dest] if dest_exists else []):
+            engine = self.get_table_engine(checked_table)
+            if (engine or '').lower() not in TRANSACTIONAL_ENGINES:
+                raise ValueError("archive_rows needs transactional tables, `%s` has engine %s"
+                                 % (checked_table, engine))
+        if dest is not None and not to_file and not dest_exists:
+            self.copy_table_structure(table, dest)  # same engine as the checked source table
+        pk_index = self.get_column_names(table).index(primary_key)
+
+        state = {'deleted': None, 'written': None}
+        if state_file and os.path.isfile(state_file):
+            with open(state_file, 'rb') as fd:
+                state = pickle.load(fd)
+
+        archived, chunks, start = 0, 0, time.time()
+        while True:
+            sql = "SELECT * FROM `%s` WHERE (%s)" % (table, where)
+            if state['deleted'] is not None:
+                sql += " AND `%s` > %s" % (primary_key, self.conn.escape(state['deleted']))
+            try:
+                # rows of the chunk are locked until commit, so exactly the rows read are archived and deleted
+                self.conn.begin()
+                self.cursor.execute(sql + " ORDER BY `%s` LIMIT %d FOR UPDATE" % (primary_key, chunk_rows))
+                rows = self.cursor.fetchall()
+                if not rows:
+                    self.conn.commit()
+                    break
+                last_pk = rows[-1][pk_index]
+                chunk_condition = "`%s` IN (%s)" % (primary_key,
+                                                    ", ".join([self.conn.escape(r[pk_index]) for r in rows]))
+
+                if to_file:
+                    # rows already written before an interruption are not written twice
+                    if state['written'] is not None:
+                        rows = [r for r in rows if r[pk_index] > state['written']]
+                    with gzip.open(dest, 'at', newline='') as fd:
+                        writer = csv.writer(fd, delimiter='\t', lineterminator='\n')
+                        writer.writerows([['\\N' if x is None else x for x in r] for r in rows])
+                    state['written'] = last_pk
+                    self.__save_state(state_file, state)
+                elif dest is not None:
+                    self.cursor.execute("INSERT INTO `%s` SELECT * FROM `%s` WHERE %s" % (dest, table, chunk_condition))
+                archived += self.cursor.execute("DELETE FROM `%s` WHERE %s" % (table, chunk_condition))
+                self.conn.commit()
+            except:
+                self.conn.rollback()
+                raise
+            state['deleted'] = last_pk
+            self.__save_state(state_file, state)
+
+            chunks += 1
+            seconds = time.time() - start
+            print("archived %d rows from `%s` in %.1f s (%.0f rows/s)" % (archived, table, seconds,
+                                                                            archived / seconds if seconds else 0))
+            if sleep:
+                time.sleep(sleep)
+
+        if state_file and os.path.isfile(state_file):
+            os.remove(state_file)
+        seconds = time.time() - start
+        return {'rows': archived, 'chunks': chunks, 'seconds': seconds,
+                'rows_per_second': archived / seconds if seconds else 0}
+
+    def get_table_engine(self, table, database=None):
+        """returns the storage engine of a table (None if table not exists)
+        :param table: table name
+        :type table: str
+        :param database: database name (default connected database)
+        :type database: str
+        """
+        if not database:
+            database = self.get_database_name()
+        self.cursor.execute("SELECT ENGINE FROM information_schema.TABLES WHERE TABLE_SCHEMA='%s' AND TABLE_NAME='%s'"
+                            % (database, table))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def __save_state(self, state_file, state):
+        """pickle progress state of chunked operations to state_file (if given)"""
+        if state_file:
+            with open(state_file, 'wb') as fd:
+                pickle.dump(state, fd)
 
     def truncate_table(self, table, resetPrimaryKey=True):
         """truncate table"""
-        self.cursor.execute("truncate " + table)
+        self.execute_ddl("truncate `%s`" % table, table)
         if resetPrimaryKey:
-            self.cursor.execute("ALTER TABLE %s AUTO_INCREMENT = 1" % table)
+            self.execute_ddl("ALTER TABLE %s AUTO_INCREMENT = 1" % table, table)
 
     def truncate_tables(self, tables):
         """truncate tables"""
@@ -725,4 +1334,4 @@ class MySQLTools:
         if prefix:
             tables = [x for x in tables if x.starts_with(prefix)]
         for table in tables:
-            self.cursor.execute("truncate `" + table + "`")
+            self.execute_ddl("truncate `" + table + "`", table)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+Streaming inference of compact MySQL column types for csv2db_from_file
+@author: Christian Ebeling
+@contact: chr.ebeling@gmail.com
+every value is seen only once, per column integer range, decimal precision, date/datetime format,
+maximal length, empty values and a small domain of distinct values are tracked"""
+
+import re
+import datetime
+import unicodedata
+
+INT_PATTERN = re.compile(r"^-?(0|[1-9]\d*)$")
+DECIMAL_PATTERN = re.compile(r"^-?(0|[1-9]\d*)\.(\d+)$")
+DATE_PATTERN = re.compile(r"^[12]\d{3}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])$")
+DATETIME_PATTERN = re.compile(r"^[12]\d{3}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])[ T]([01]\d|2[0-3]):[0-5]\d:[0-5]\d(\.\d{1,6})?$")
+
+def collation_key(value):
+    """value as compared by the default collations (*_general_ci, *_0900_ai_ci): case and accent insensitive,
+    trailing spaces are ignored (PAD SPACE)"""
+    decomposed = unicodedata.normalize('NFKD', value)
+    return "".join([x for x in decomposed if not unicodedata.combining(x)]).casefold().rstrip(' ')
+
+
+def valid_date(value):
+    """True if the date part (YYYY-MM-DD) of value exists, e.g. not 2017-02-30"""
+    try:
+        datetime.date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+    except ValueError:
+        return False
+    return True
+
+
+# (type, signed min, signed max, unsigned max)
+INT_TYPES = (
+    ('tinyint', -2 ** 7, 2 ** 7 - 1, 2 ** 8 - 1),
+    ('smallint', -2 ** 15, 2 ** 15 - 1, 2 ** 16 - 1),
+    ('mediumint', -2 ** 23, 2 ** 23 - 1, 2 ** 24 - 1),
+    ('int', -2 ** 31, 2 ** 31 - 1, 2 ** 32 - 1),
+    ('bigint', -2 ** 63, 2 ** 63 - 1, 2 ** 64 - 1),
+)
+
+# maximal row size of MySQL tables (all engines), TEXT columns count only with their pointer
+ROW_SIZE_LIMIT = 65535
+FIXED_BYTES = {'tinyint': 1, 'smallint': 2, 'mediumint': 3, 'int': 4, 'bigint': 8, 'date': 3, 'datetime': 8,
+               'enum': 2, 'text': 12, 'mediumtext': 12, 'longtext': 12}
+DECIMAL_DIGIT_BYTES = (0, 1, 1, 2, 2, 3, 3, 4, 4, 4)  # bytes of 0-8 leftover digits, 9 digits need 4 bytes
+
+
+def column_bytes(sql_type, max_bytes_per_char=4):
+    """returns the bytes a column definition of ColumnTypeInference.sql_type counts in the row size"""
+    type_name = re.match(r"[a-z]+", sql_type).group(0)
+    if type_name == 'varchar':
+        length = int(re.match(r"varchar\((\d+)\)", sql_type).group(1)) * max_bytes_per_char
+        return length + (1 if length <= 255 else 2)
+    if type_name == 'decimal':
+        precision, scale = [int(x) for x in re.match(r"decimal\((\d+),(\d+)\)", sql_type).groups()]
+        return sum([digits // 9 * 4 + DECIMAL_DIGIT_BYTES[digits % 9] for digits in (precision - scale, scale)])
+    return FIXED_BYTES[type_name]
+
+
+class ColumnTypeInference:
+    """collects statistics of the values of one column and returns the most compact MySQL type for them
+    empty values are NULL in numeric and date columns, in string columns they are kept as ''
+    :param enum_max: maximal number of distinct values for an ENUM (0 = no ENUM)
+    """
+
+    def __init__(self, enum_max=16):
+        self.enum_max = enum_max
+        self.count = 0
+        self.empties = 0
+        self.max_length = 0
+        self.is_int = self.is_decimal = self.is_date = self.is_datetime = True
+        self.min_int = self.max_int = None
+        self.int_digits = self.scale = 0
+        self.fraction = False
+        self.distinct = set() if enum_max else None
+        self.folded = set()
+
+    def add(self, value):
+        self.count += 1
+        if value == '':
+            self.empties += 1
+            return
+        self.max_length = max(self.max_length, len(value))
+        if self.distinct is not None:
+            self.distinct.add(value)
+            self.folded.add(collation_key(value))
+            # ENUM values must be unique in the (default case and accent insensitive) collation
+            if len(self.distinct) > self.enum_max or len(self.folded) != len(self.distinct):
+                self.distinct = None
+        if self.is_int:
+            if INT_PATTERN.match(value):
+                number = int(value)
+                self.min_int = number if self.min_int is None else min(self.min_int, number)
+                self.max_int = number if self.max_int is None else max(self.max_int, number)
+            else:
+                self.is_int = False
+        if self.is_decimal:
+            match = DECIMAL_PATTERN.match(value) or INT_PATTERN.match(value)
+            if match:
+                self.int_digits = max(self.int_digits, len(match.group(1)))
+                if match.re is DECIMAL_PATTERN:
+                    self.scale = max(self.scale, len(match.group(2)))
+            else:
+                self.is_decimal = False
+        if self.is_date and not (DATE_PATTERN.match(value) and valid_date(value)):
+            self.is_date = False
+        if self.is_datetime and not self.is_date:
+            if (DATETIME_PATTERN.match(value) or DATE_PATTERN.match(value)) and valid_date(value):
+                self.fraction = self.fraction or '.' in value
+            else:
+                self.is_datetime = False
+
+    def is_string(self):
+        return not self.numeric_or_date_type()
+
+    def numeric_or_date_type(self):
+        """returns numeric or date type or None if the column is a string column"""
+        if self.count == self.empties:
+            return None
+        if self.is_int:
+            unsigned = self.min_int >= 0
+            for type_name, signed_min, signed_max, unsigned_max in INT_TYPES:
+                if unsigned and self.max_int <= unsigned_max:
+                    return type_name + " unsigned"
+                if not unsigned and signed_min <= self.min_int and self.max_int <= signed_max:
+                    return type_name
+        if self.is_decimal and self.int_digits + self.scale <= 65 and self.scale <= 30:
+            return "decimal(%d,%d)" % (self.int_digits + self.scale, self.scale)
+        if self.is_date:
+            return "date"
+        if self.is_datetime:
+            return "datetime(6)" if self.fraction else "datetime"
+        return None
+
+    def sql_type(self):
+        """returns column definition, e.g. 'smallint unsigned NOT NULL'"""
+        null = " NULL" if self.empties else " NOT NULL"
+        type_name = self.numeric_or_date_type()
+        if type_name:
+            return type_name + null
+        if self.distinct and len(self.distinct) * 4 <= self.count - self.empties:
+            return "enum(%s)" % ",".join(["'" + x.replace("'", "''") + "'" for x in sorted(self.distinct)]) + null
+        if self.max_length <= 255:
+            return "varchar(%d)" % max(self.max_length, 1) + null
+        if self.max_length <= 16383:  # 65535 bytes with 4 bytes per character
+            return "text" + null
+        if self.max_length <= 4194303:
+            return "mediumtext" + null
+        return "longtext" + null
+
+
+class TableTypeInference:
+    """ColumnTypeInference for all columns of a CSV file
+    :param max_bytes_per_char: maximal bytes per character of the table charset (utf8mb4: 4), varchar columns
+                               which would exceed the row size limit of 65535 bytes become text
+    """
+
+    def __init__(self, number_of_columns, enum_max=16, max_bytes_per_char=4):
+        self.columns = [ColumnTypeInference(enum_max) for i in range(number_of_columns)]
+        self.max_bytes_per_char = max_bytes_per_char
+        self.text_columns = set()  # once text, always text (later widening never shrinks a column)
+
+    def add(self, row):
+        """add one parsed row, missing values are empty, surplus values are ignored, empty rows are skipped"""
+        if not row:
+            return
+        for i, column in enumerate(self.columns):
+            column.add(row[i].strip() if i < len(row) else '')
+
+    def sql_types(self):
+        """returns column definitions, varchar columns become text as soon as the row size budget is used up"""
+        sql_types = [column.sql_type() for column in self.columns]
+        varchars = [i for i, x in enumerate(sql_types) if x.startswith('varchar')]
+        # 1 bit per nullable column, 1 byte for the delete flag of MyISAM, every varchar needs at least a text pointer
+        budget = ROW_SIZE_LIMIT - (len(sql_types) + 7) // 8 - 1 - FIXED_BYTES['text'] * len(varchars)
+        budget -= sum([column_bytes(x, self.max_bytes_per_char) for x in sql_types if not x.startswith('varchar')])
+        for i in varchars:
+            extra = column_bytes(sql_types[i], self.max_bytes_per_char) - FIXED_BYTES['text']
+            if i in self.text_columns or extra > budget:
+                self.text_columns.add(i)
+                sql_types[i] = "text" + sql_types[i][sql_types[i].index(')') + 1:]
+            else:
+                budget -= extra
+        return sql_types
+
+    def empty_to_null(self):
+        """returns indices of columns where empty values have to be inserted as NULL"""
+        return set(i for i, column in enumerate(self.columns) if not column.is_string())
+
+    def freeze_enums(self):
+        """stop collecting distinct values of columns which are not ENUM yet, after the table is created
+        from a sample further rows may only widen the types, not turn a varchar into an ENUM"""
+        for column in self.columns:
+            if not column.sql_type().startswith('enum'):
+                column.distinct = None
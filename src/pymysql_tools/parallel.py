@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""
+Parallel loading of one CSV file over several processes and connections
+@author: Christian Ebeling
+@contact: chr.ebeling@gmail.com
+the file is split into byte ranges starting at record boundaries (quoted newlines are respected),
+every worker process parses its ranges and inserts them over its own connection"""
+
+import csv
+import mmap
+import os
+import sys
+import multiprocessing
+
+import pymysql
+
+# connection of the worker process, opened once in _init_worker and reused for all ranges
+_worker = {}
+
+
+def _raise_field_size_limit():
+    """columns are text, the default limit of the csv module (131072 characters) is too small"""
+    limit = sys.maxsize
+    while csv.field_size_limit() < limit:
+        try:
+            csv.field_size_limit(limit)
+        except OverflowError:  # limit has to fit into a C long
+            limit //= 2
+
+
+def csv_reader(lines, delimiter, quotechar=None):
+    """csv.reader for the csv2db_from_file format, without quotechar quotes are part of the values"""
+    _raise_field_size_limit()
+    if quotechar:
+        return csv.reader(lines, delimiter=delimiter, quotechar=quotechar)
+    return csv.reader(lines, delimiter=delimiter, quoting=csv.QUOTE_NONE)
+
+
+def insert_rows(cursor, table, number_of_columns, rows, empty_to_null=()):
+    """inserts rows with one multi row INSERT, short rows are filled with ''
+    empty values in columns with index in empty_to_null are inserted as NULL
+    empty rows (blank lines) are skipped, returns number of inserted rows"""
+    sql = "INSERT INTO `%s` VALUES (%s)" % (table, ", ".join(["%s"] * number_of_columns))
+    values = [[x.strip() for x in row[:number_of_columns]] + [''] * (number_of_columns - len(row))
+              for row in rows if row]
+    if empty_to_null:
+        values = [[None if x == '' and i in empty_to_null else x for i, x in enumerate(row)] for row in values]
+    if values:
+        cursor.executemany(sql, values)
+    return len(values)
+
+
+def record_end(path, offset, quotechar=None, boundary=0, delimiter='\t'):
+    """returns the byte offset of the first record starting at or after offset (end of file if none)
+    a record ends with a newline outside of a quoted field. Like csv.reader a quotechar only opens a quoted
+    field at the start of a field (after delimiter, newline or the known record boundary), elsewhere it is
+    part of the value (e.g. 5" wide); inside a quoted field a doubled quotechar is an escaped quote.
+    The file is scanned from boundary (default start of file) with find from quote to quote (fast)."""
+    size = os.path.getsize(path)
+    if offset <= boundary or offset >= size:
+        return min(max(offset, boundary), size)
+    # search starts one byte before offset, so offset is returned if a record ends just before it
+    search_from = offset - 1
+    with open(path, 'rb') as fd, mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if not quotechar:
+            newline = data.find(b'\n', search_from)
+            return size if newline < 0 else newline + 1
+        quote = quotechar.encode()
+        field_starts = (delimiter.encode(), b'\n', b'\r')
+        position = boundary  # outside of quoted fields
+        while True:
+            next_quote = data.find(quote, position)
+            # newlines between position and next_quote are outside of quoted fields
+            newline = data.find(b'\n', max(position, search_from), size if next_quote < 0 else next_quote)
+            if newline >= 0:
+                return newline + 1
+            if next_quote < 0:
+                return size
+            if next_quote > boundary and data[next_quote - 1:next_quote] not in field_starts:
+                position = next_quote + 1  # literal quote in an unquoted field
+                continue
+            closing = next_quote + 1
+            while True:
+                closing = data.find(quote, closing)
+                if closing < 0:
+                    return size  # unterminated quoted field
+                if data[closing + 1:closing + 2] != quote:
+                    break
+                closing += 2  # escaped quote
+            position = closing + 1
+
+
+def split_csv_file(path, parts, start=0, quotechar=None, delimiter='\t'):
+    """splits the file (from byte start) in about equal byte ranges [(start, end),...] aligned on record boundaries"""
+    size = os.path.getsize(path)
+    boundaries = [start]
+    for i in range(1, parts):
+        boundary = record_end(path, start + (size - start) * i // parts, quotechar, boundaries[-1], delimiter)
+        if boundary > boundaries[-1]:
+            boundaries.append(boundary)
+    if size > boundaries[-1]:
+        boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _iter_lines(fd, start, end, encoding):
+    """yields decoded lines of a byte range"""
+    fd.seek(start)
+    position = start
+    while position < end:
+        line = fd.readline()
+        if not line:
+            break
+        position += len(line)
+        yield line.decode(encoding)
+
+
+def _init_worker(connect_args, connect_kwargs, database):
+    _worker['conn'] = pymysql.Connection(*connect_args, **connect_kwargs)
+    _worker['conn'].select_db(database)
+    _worker['cursor'] = _worker['conn'].cursor()
+    _worker['staging_table'] = None
+
+
+def _load_range(task):
+    """loads one byte range, returns (number of rows, staging table name or None)"""
+    path, start, end, table, number_of_columns, parameters = task
+    cursor = _worker['cursor']
+    if parameters['staging']:
+        if not _worker['staging_table']:
+            _worker['staging_table'] = "%s_stage_%d" % (table, os.getpid())
+            cursor.execute("CREATE TABLE `%s` LIKE `%s`" % (_worker['staging_table'], table))
+        table = _worker['staging_table']
+    loaded, batch = 0, []
+    with open(path, 'rb') as fd:
+        lines = _iter_lines(fd, start, end, parameters['encoding'])
+        for row in csv_reader(lines, parameters['delimiter'], parameters['field_enclosed_by']):
+            batch.append(row)
+            if len(batch) >= parameters['batch_rows']:
+                loaded += insert_rows(cursor, table, number_of_columns, batch, parameters['empty_to_null'])
+                _worker['conn'].commit()
+                batch = []
+    if batch:
+        loaded += insert_rows(cursor, table, number_of_columns, batch, parameters['empty_to_null'])
+        _worker['conn'].commit()
+    return loaded, _worker['staging_table']
+
+
+def _drop_staging_tables(tools, table):
+    """drops all staging tables of table, also of workers which failed before they returned their name"""
+    prefix = "%s_stage_" % table
+    for staging_table in tools.get_table_names():
+        if staging_table.startswith(prefix) and staging_table[len(prefix):].isdigit():
+            tools.drop_table(staging_table)
+
+
+def load_csv_parallel(tools, path, start, table, number_of_columns, parameters):
+    """loads the file from byte offset start into table with parameters['workers'] processes
+    if a worker fails the other workers are terminated and the staging tables are dropped, with staging
+    table is unchanged then (without staging the ranges loaded so far stay in table)
+    :param tools: MySQLTools of the table (used for connection parameters and merging)
+    :param path: path to CSV file
+    :param start: byte offset of the first data record (after header)
+    :param table: existing table name
+    :param number_of_columns: number of columns in table
+    :param parameters: csv2db_from_file parameters (workers, staging, delimiter, field_enclosed_by, ...)
+    @return: number of loaded rows
+    """
+    workers = parameters['workers']
+    ranges = split_csv_file(path, workers * 4, start, parameters['field_enclosed_by'], parameters['delimiter'])
+    tasks = [(path, range_start, range_end, table, number_of_columns, parameters) for range_start, range_end in ranges]
+    loaded, staging_tables = 0, set()
+    pool = multiprocessing.Pool(workers, _init_worker,
+                                (tools.connect_args, tools.connect_kwargs, tools.get_database_name()))
+    try:
+        for done, (rows, staging_table) in enumerate(pool.imap_unordered(_load_range, tasks), 1):
+            loaded += rows
+            if staging_table:
+                staging_tables.add(staging_table)
+            print("loaded %d rows into `%s` (%d/%d ranges)" % (loaded, table, done, len(tasks)))
+    except:
+        # do not wait for the remaining ranges, the connections of the workers are closed with them
+        pool.terminate()
+        pool.join()
+        if parameters['staging']:
+            _drop_staging_tables(tools, table)
+        raise
+    pool.close()
+    pool.join()
+    try:
+        for staging_table in sorted(staging_tables):
+            tools.cursor.execute("INSERT INTO `%s` SELECT * FROM `%s`" % (table, staging_table))
+            tools.conn.commit()
+            tools.drop_table(staging_table)
+    except:
+        _drop_staging_tables(tools, table)
+        raise
+    return loaded
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+Incremental synchronisation of tables between two MySQLTools connections
+@author: Christian Ebeling
+@contact: chr.ebeling@gmail.com
+only rows with a watermark (e.g. `updated_at`) >= last stored watermark are copied,
+the watermark is stored in the destination database in the same transaction as the rows"""
+
+import pymysql
+
+
+def _quoted(columns):
+    return ", ".join(["`" + x + "`" for x in columns])
+
+
+def _key_tuple(key_columns):
+    return "(" + _quoted(key_columns) + ")"
+
+
+def _get_watermark(dst_tools, state_table, source, table):
+    dst_tools.cursor.execute("""CREATE TABLE IF NOT EXISTS `%s` (
+        `source` varchar(255) NOT NULL,
+        `table_name` varchar(64) NOT NULL,
+        `watermark` varchar(64) DEFAULT NULL,
+        PRIMARY KEY (`source`, `table_name`)) ENGINE=InnoDB""" % state_table)
+    dst_tools.cursor.execute("SELECT `watermark` FROM `%s` WHERE `source`=%%s AND `table_name`=%%s" % state_table,
+                             (source, table))
+    row = dst_tools.cursor.fetchone()
+    return row[0] if row else None
+
+
+def _set_watermark(dst_tools, state_table, source, table, watermark):
+    dst_tools.cursor.execute("REPLACE INTO `%s` (`source`, `table_name`, `watermark`) VALUES (%%s, %%s, %%s)"
+                             % state_table, (source, table, str(watermark)))
+
+
+def _delete_missing_rows(src_tools, dst_tools, table, key_columns, chunk_rows):
+    """walks the keys of the source in chunks and deletes keys in the same range of the destination
+    which are not in the source, returns number of deleted rows
+    the keys are compared by the destination server, so its collation decides (e.g. 'abc' = 'ABC')
+    like it does for the upserts"""
+    deleted = 0
+    previous = None
+    key_sql = _key_tuple(key_columns)
+    placeholder = "(" + ", ".join(["%s"] * len(key_columns)) + ")"
+    while True:
+        sql = "SELECT %s FROM `%s`" % (_quoted(key_columns), table)
+        if previous is not None:
+            sql += " WHERE %s > %s" % (key_sql, placeholder)
+        src_tools.cursor.execute(sql + " ORDER BY %s LIMIT %d" % (_quoted(key_columns), chunk_rows),
+                                 previous)
+        rows = src_tools.cursor.fetchall()
+        last = rows[-1] if rows else None  # last in MySQL order (collation), not python order
+
+        conditions, args = [], []
+        if previous is not None:
+            conditions.append("%s > %s" % (key_sql, placeholder))
+            args += list(previous)
+        if last is not None:
+            conditions.append("%s <= %s" % (key_sql, placeholder))
+            args += list(last)
+            conditions.append("%s NOT IN (%s)" % (key_sql, ", ".join([placeholder] * len(rows))))
+            args += [v for key in rows for v in key]
+        sql = "DELETE FROM `%s`" % table
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        deleted += dst_tools.cursor.execute(sql, args)
+        dst_tools.conn.commit()
+
+        if last is None:
+            return deleted
+        previous = last
+
+
+def sync_table(src_tools, dst_tools, table, key=None, watermark_column='updated_at', batch_rows=1000,
+               detect_deletes=False, state_table='sync_watermarks'):
+    """Copies rows changed since the last run from src_tools to dst_tools with batched upserts.
+    The destination table is created with the structure of the source table if it not exists.
+
+    :param src_tools: source connection
+    :type src_tools: MySQLTools
+    :param dst_tools: destination connection
+    :type dst_tools: MySQLTools
+    :param table: table name (same in both databases)
+    :type table: str
+    :param key: unique key column(s) of the table (default primary key of source table)
+    :type key: str or iterable of str
+    :param watermark_column: NOT NULL column which increases with every change of a row (datetime or int)
+    :type watermark_column: str
+    :param batch_rows: number of rows per upsert (and per chunk of key comparison)
+    :type batch_rows: int
+    :param detect_deletes: True = deletes rows in destination which are not in the source (walks all keys)
+    :type detect_deletes: bool
+    :param state_table: table in the destination database to store the watermarks
+    :type state_table: str
+    @return: dictionary {'upserted': number of copied rows, 'deleted': number of deleted rows,
+             'watermark': new watermark}
+    """
+    if key is None:
+        key = src_tools.get_primary_key(table)
+        if not key:
+            raise ValueError("table `%s` has no single column primary key, key is needed" % table)
+    key_columns = [key] if type(key) == str else list(key)
+
+    if not dst_tools.table_exists(table):
+        src_tools.cursor.execute("show create table `%s`" % table)
+        dst_tools.cursor.execute(src_tools.cursor.fetchone()[1])
+
+    if src_tools.get_column_information_schema(table, watermark_column)['IS_NULLABLE'] == 'YES':
+        # rows with NULL would never be found by `watermark_column` >= watermark
+        raise ValueError("watermark column `%s`.`%s` must be NOT NULL" % (table, watermark_column))
+
+    source = "%s/%s" % (src_tools.get_hostname(), src_tools.get_database_name())
+    watermark = _get_watermark(dst_tools, state_table, source, table)
+    columns = src_tools.get_column_names(table)
+    watermark_index = columns.index(watermark_column)
+
+    # >= because rows with the same watermark could be committed after the last run, upserts are idempotent
+    sql = "SELECT %s FROM `%s`" % (_quoted(columns), table)
+    if watermark is not None:
+        sql += " WHERE `%s` >= %s" % (watermark_column, src_tools.conn.escape(watermark))
+    sql += " ORDER BY `%s`" % watermark_column
+    update_columns = [x for x in columns if x not in key_columns] or key_columns[:1]
+    upsert = "INSERT INTO `%s` (%s) VALUES (%s) ON DUPLICATE KEY UPDATE %s" % (
+        table, _quoted(columns), ", ".join(["%s"] * len(columns)),
+        ", ".join(["`%s`=VALUES(`%s`)" % (x, x) for x in update_columns]))
+
+    upserted = 0
+    ss_cursor = src_tools.conn.cursor(pymysql.cursors.SSCursor)
+    try:
+        ss_cursor.execute(sql)
+        while True:
+            rows = ss_cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            try:
+                dst_tools.cursor.executemany(upsert, rows)
+                watermark = rows[-1][watermark_index]
+                _set_watermark(dst_tools, state_table, source, table, watermark)
+                dst_tools.conn.commit()
+            except:
+                dst_tools.conn.rollback()
+                raise
+            upserted += len(rows)
+    finally:
+        ss_cursor.close()
+
+    deleted = 0
+    if detect_deletes:
+        deleted = _delete_missing_rows(src_tools, dst_tools, table, key_columns, batch_rows)
+
+    return {'upserted': upserted, 'deleted': deleted, 'watermark': watermark}
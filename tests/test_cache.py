@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from pymysql_tools.cache import AnalyseCache
+from pymysql_tools.db import normalize_column_type
+
+
+class TestAnalyseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.file_location = os.path.join(self.folder.name, 'analyse.pickle')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_hit_only_with_same_marker(self):
+        cache = AnalyseCache(self.file_location)
+        self.assertIsNone(cache.get('t', ('MyISAM', 1)))
+        cache.set('t', ('MyISAM', 1), {'c': {}})
+        self.assertEqual(cache.get('t', ('MyISAM', 1)), {'c': {}})
+        self.assertIsNone(cache.get('t', ('MyISAM', 2)))
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_none_marker_is_never_cached(self):
+        cache = AnalyseCache(self.file_location)
+        cache.set('t', ('MyISAM', 1), {})
+        cache.set('t', None, {})
+        self.assertEqual(len(cache), 0)
+        self.assertIsNone(cache.get('t', None))
+
+    def test_lru_eviction(self):
+        cache = AnalyseCache(self.file_location, max_entries=2)
+        cache.set('a', 1, 'A')
+        cache.set('b', 1, 'B')
+        cache.get('a', 1)
+        cache.set('c', 1, 'C')
+        self.assertEqual(cache.get('b', 1), None)
+        self.assertEqual(cache.get('a', 1), 'A')
+        self.assertEqual(cache.get('c', 1), 'C')
+
+    def test_save_load(self):
+        cache = AnalyseCache(self.file_location)
+        cache.set(('host', 'db', 't', None), ('InnoDB', '2017-01-01 00:00:00', 10, 'abc'), {'c': {'Nulls': 0}})
+        cache.save()
+        loaded = AnalyseCache(self.file_location)
+        self.assertEqual(loaded.get(('host', 'db', 't', None), ('InnoDB', '2017-01-01 00:00:00', 10, 'abc')),
+                         {'c': {'Nulls': 0}})
+
+    def test_unreadable_file(self):
+        with open(self.file_location, 'wb') as fd:
+            fd.write(b'no pickle')
+        self.assertEqual(len(AnalyseCache(self.file_location)), 0)
+
+
+class TestNormalizeColumnType(unittest.TestCase):
+
+    def test_same_type(self):
+        self.assertEqual(normalize_column_type('TINYINT(3) UNSIGNED NOT NULL'),
+                         normalize_column_type('tinyint(3) unsigned NOT NULL'))
+        self.assertEqual(normalize_column_type("ENUM('a', 'B') NOT NULL"),
+                         normalize_column_type("enum('a','B') NOT NULL"))
+
+    def test_integer_display_width(self):
+        # analyse_table proposes 'INT  NOT NULL' for number only ENUMs, 5.7 describes the column as int(11)
+        self.assertEqual(normalize_column_type('INT  NOT NULL'), normalize_column_type('int(11) NOT NULL'))
+        self.assertEqual(normalize_column_type('TINYINT(3) UNSIGNED'), normalize_column_type('tinyint unsigned'))
+        self.assertNotEqual(normalize_column_type('DECIMAL(10,2)'), normalize_column_type('decimal'))
+        self.assertNotEqual(normalize_column_type("ENUM('int(1)')"), normalize_column_type("enum('int')"))
+
+    def test_different_type(self):
+        self.assertNotEqual(normalize_column_type('INT(11) UNSIGNED NOT NULL'), normalize_column_type('int(11)'))
+        self.assertNotEqual(normalize_column_type('INT(11) UNSIGNED NOT NULL'),
+                            normalize_column_type('int(11) NOT NULL'))
+        self.assertNotEqual(normalize_column_type('INT(11) NOT NULL'), normalize_column_type('int(11)'))
+        self.assertNotEqual(normalize_column_type("ENUM('a','b') NOT NULL"),
+                            normalize_column_type("enum('A','b') NOT NULL"))
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+from decimal import Decimal
+
+from pymysql_tools.columns import new_column_buffer, numpy, NumericColumn, DictionaryColumn, ObjectColumn
+
+
+def column_info(data_type, column_type=None, nullable='NO'):
+    return {'DATA_TYPE': data_type, 'COLUMN_TYPE': column_type or data_type, 'IS_NULLABLE': nullable}
+
+
+class TestColumnBuffers(unittest.TestCase):
+
+    def test_buffer_types(self):
+        self.assertIsInstance(new_column_buffer(column_info('int')), NumericColumn)
+        self.assertIsInstance(new_column_buffer(column_info('varchar', 'varchar(10)')), DictionaryColumn)
+        self.assertIsInstance(new_column_buffer(column_info('date')), ObjectColumn)
+        self.assertEqual(new_column_buffer(column_info('int', 'int(10) unsigned')).values.typecode, 'I')
+        self.assertEqual(new_column_buffer(column_info('tinyint', 'tinyint(4)')).values.typecode, 'b')
+
+    def test_numeric_nulls(self):
+        column = new_column_buffer(column_info('decimal', 'decimal(5,2)', 'YES'))
+        for value in (Decimal('1.50'), None, 3):
+            column.append(value)
+        self.assertEqual(list(column.values), [1.5, 0.0, 3.0])
+        self.assertEqual(list(column.nulls), [0, 1, 0])
+        self.assertIsNone(new_column_buffer(column_info('int')).nulls)
+
+    def test_decimal_precision(self):
+        self.assertIsInstance(new_column_buffer(column_info('decimal', 'decimal(15,2)')), NumericColumn)
+        self.assertIsInstance(new_column_buffer(column_info('decimal')), NumericColumn)
+        column = new_column_buffer(column_info('decimal', 'decimal(20,2)'))
+        self.assertIsInstance(column, ObjectColumn)
+        column.append(Decimal('123456789012345678.91'))
+        self.assertEqual(column.values, [Decimal('123456789012345678.91')])
+
+    def test_dictionary_encoding(self):
+        column = new_column_buffer(column_info('varchar', 'varchar(1)', 'YES'))
+        for value in ('a', 'b', 'a', None):
+            column.append(value)
+        self.assertEqual(list(column.codes), [0, 1, 0, -1])
+        self.assertEqual(column.dictionary, ['a', 'b'])
+        self.assertEqual(column.decode(), ['a', 'b', 'a', None])
+
+    def test_dictionary_shared_over_chunks(self):
+        first = new_column_buffer(column_info('varchar'))
+        for value in ('a', 'b'):
+            first.append(value)
+        second = new_column_buffer(column_info('varchar'), shared=first)
+        for value in ('b', 'c'):
+            second.append(value)
+        self.assertEqual(list(second.codes), [1, 2])
+        self.assertEqual(second.decode(), ['b', 'c'])
+
+    def test_dictionary_fallback_over_chunks(self):
+        first = new_column_buffer(column_info('varchar'), max_dictionary_size=2)
+        for value in ('a', 'b', 'c'):
+            first.append(value)
+        self.assertIsNone(first.codes)
+        self.assertEqual(first.decode(), ['a', 'b', 'c'])
+        second = new_column_buffer(column_info('varchar'), max_dictionary_size=2, shared=first)
+        second.append('a')
+        self.assertIsNone(second.codes)
+        self.assertEqual(second.decode(), ['a'])
+
+    @unittest.skipIf(numpy is None, "numpy not installed")
+    def test_to_numpy(self):
+        column = new_column_buffer(column_info('int', 'int(11)', 'YES'))
+        for value in (1, None):
+            column.append(value)
+        values = column.to_numpy()
+        self.assertEqual(values.mask.tolist(), [False, True])
+        column = new_column_buffer(column_info('varchar'))
+        for value in ('x', 'y', 'x'):
+            column.append(value)
+        codes, dictionary = column.to_numpy()
+        self.assertEqual(dictionary[codes].tolist(), ['x', 'y', 'x'])
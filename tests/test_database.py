@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
 
+import gzip
+import os
+import pickle
+import tempfile
 import unittest
+import pymysql
 import pymysql_tools
 
 host = 'localhost'
 user = 'test_user_pymysql_tools'
 passwd = 'testpasswd'
 database = 'test_pymysql_tools'
+database_sync = 'test_pymysql_tools_sync'
 
 
 class TestDatabases(unittest.TestCase):
@@ -14,6 +20,186 @@ class TestDatabases(unittest.TestCase):
     def setUp(self):
         self.pt = pymysql_tools.connect(host, user, passwd, database)
 
+    def tearDown(self):
+        self.pt.drop_tables(['test_archive', 'test_archive_dest', 'test_csv_infer', 'test_bulk', 'test_bulk_ft'])
+        self.pt.conn.close()
+
+    def create_test_table(self, table, rows=10, engine='InnoDB'):
+        self.pt.cursor.execute("CREATE TABLE `%s` (`id` int NOT NULL PRIMARY KEY, `v` int) ENGINE=%s"
+                               % (table, engine))
+        self.pt.cursor.executemany("INSERT INTO `%s` VALUES (%%s, %%s)" % table,
+                                   [(i, i % 2) for i in range(1, rows + 1)])
+        self.pt.conn.commit()
+
     def test_database(self):
         self.pt = pymysql_tools.connect(host, user, passwd, database)
         self.assertEqual(self.pt.get_database_name(), database)
+
+    def test_archive_rows_to_table(self):
+        self.create_test_table('test_archive')
+        result = self.pt.archive_rows('test_archive', '`v` = 0', dest='test_archive_dest', chunk_rows=2)
+        self.assertEqual(result['rows'], 5)
+        self.pt.cursor.execute("SELECT `id` FROM `test_archive_dest` ORDER BY `id`")
+        self.assertEqual([x[0] for x in self.pt.cursor.fetchall()], [2, 4, 6, 8, 10])
+        self.pt.cursor.execute("SELECT count(*) FROM `test_archive` WHERE `v` = 0")
+        self.assertEqual(self.pt.cursor.fetchone()[0], 0)
+
+    def test_archive_rows_to_file_resume(self):
+        self.create_test_table('test_archive')
+        with tempfile.TemporaryDirectory() as folder:
+            dest = os.path.join(folder, 'archive.gz')
+            # interrupted run: rows 1 and 2 written to file but not deleted
+            with gzip.open(dest, 'wt') as fd:
+                fd.write("1\t1\n2\t0\n")
+            with open(dest + '.state', 'wb') as fd:
+                pickle.dump({'deleted': None, 'written': 2}, fd)
+            result = self.pt.archive_rows('test_archive', '1', dest=dest, chunk_rows=3)
+            with gzip.open(dest, 'rt') as fd:
+                ids = [int(x.split("\t")[0]) for x in fd]
+            self.assertEqual(ids, list(range(1, 11)))
+            self.assertEqual(result['rows'], 10)
+            self.assertFalse(os.path.isfile(dest + '.state'))
+
+    def test_archive_rows_refuses_myisam(self):
+        self.create_test_table('test_archive', engine='MyISAM')
+        with self.assertRaises(ValueError):
+            self.pt.archive_rows('test_archive', '1', dest='test_archive_dest')
+        self.assertFalse(self.pt.table_exists('test_archive_dest'))
+
+    def test_csv2db_infer_types_widening(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'test_csv_infer.csv')
+            with open(path, 'w') as fd:
+                fd.write("id\tv\n1\t\n2\t\n3\t\n4\t7\n5\t\n")
+            loaded = self.pt.csv2db_from_file(path, first_line_columns=True, infer_types=True, infer_rows=3,
+                                              batch_rows=2)
+        self.assertEqual(loaded, 5)
+        self.assertEqual(self.pt.get_column_type('test_csv_infer', 'v'), 'tinyint')
+        self.pt.cursor.execute("SELECT `v` FROM `test_csv_infer` ORDER BY `id`")
+        self.assertEqual([x[0] for x in self.pt.cursor.fetchall()], [None, None, None, 7, None])
+
+    def test_bulk_load_mode_rebuilds_indices(self):
+        self.pt.cursor.execute("""CREATE TABLE `test_bulk` (`id` int NOT NULL PRIMARY KEY, `a` int, `b` varchar(50),
+            `t` text, UNIQUE KEY `u` (`a`, `b`(10)), KEY `k` (`b`) COMMENT 'comment', FULLTEXT KEY `f` (`t`))
+            ENGINE=InnoDB""")
+        before = self.pt.get_index_definitions('test_bulk')
+        with self.assertRaises(KeyError):
+            with self.pt.bulk_load_mode('test_bulk') as dropped:
+                self.assertEqual(len(dropped['test_bulk']), 3)
+                self.assertEqual([x['name'] for x in self.pt.get_index_definitions('test_bulk')], [])
+                self.pt.cursor.execute("SELECT @@SESSION.unique_checks")
+                self.assertEqual(self.pt.cursor.fetchone()[0], 0)
+                raise KeyError('indices are rebuilt after an exception')
+        after = self.pt.get_index_definitions('test_bulk')
+        self.assertEqual(sorted(before, key=lambda x: x['name']), sorted(after, key=lambda x: x['name']))
+        self.pt.cursor.execute("SELECT @@SESSION.unique_checks")
+        self.assertEqual(self.pt.cursor.fetchone()[0], 1)
+
+    def test_bulk_load_mode_two_fulltext_and_duplicates(self):
+        self.pt.cursor.execute("""CREATE TABLE `test_bulk_ft` (`id` int NOT NULL PRIMARY KEY, `a` int, `t` text,
+            `s` text, UNIQUE KEY `u` (`a`), KEY `k` (`a`), FULLTEXT KEY `f1` (`t`), FULLTEXT KEY `f2` (`s`))
+            ENGINE=InnoDB""")
+        with self.assertRaises(ValueError) as context:
+            with self.pt.bulk_load_mode('test_bulk_ft'):
+                # UNIQUE key `u` is dropped inside the block, the duplicates are inserted
+                self.pt.cursor.executemany("INSERT INTO `test_bulk_ft` VALUES (%s, %s, %s, %s)",
+                                           [(1, 7, 'x', 'y'), (2, 7, 'x', 'y')])
+                self.pt.conn.commit()
+        self.assertIn('`test_bulk_ft`.`u`', str(context.exception))
+        self.assertEqual(sorted([x['name'] for x in self.pt.get_index_definitions('test_bulk_ft')]),
+                         ['f1', 'f2', 'k'])
+
+    def test_bulk_load_mode_keep_unique(self):
+        self.pt.cursor.execute("""CREATE TABLE `test_bulk` (`id` int NOT NULL PRIMARY KEY, `a` int,
+            UNIQUE KEY `u` (`a`), KEY `k` (`a`)) ENGINE=InnoDB""")
+        with self.pt.bulk_load_mode('test_bulk', keep_unique=True) as dropped:
+            self.assertEqual([x['name'] for x in dropped['test_bulk']], ['k'])
+            self.pt.cursor.execute("INSERT INTO `test_bulk` VALUES (1, 7) ON DUPLICATE KEY UPDATE `id`=`id`")
+            self.pt.cursor.execute("INSERT INTO `test_bulk` VALUES (2, 7) ON DUPLICATE KEY UPDATE `id`=`id`")
+            self.pt.conn.commit()
+        self.pt.cursor.execute("SELECT count(*) FROM `test_bulk`")
+        self.assertEqual(self.pt.cursor.fetchone()[0], 1)
+
+
+class TestSyncTable(unittest.TestCase):
+
+    def setUp(self):
+        self.src = pymysql_tools.connect(host, user, passwd, database)
+        self.dst = pymysql_tools.connect(host, user, passwd, database_sync)
+        self.src.cursor.execute("""CREATE TABLE `test_sync` (`id` int NOT NULL PRIMARY KEY, `v` varchar(10),
+            `updated_at` int NOT NULL) ENGINE=InnoDB""")
+        self.src.cursor.executemany("INSERT INTO `test_sync` VALUES (%s, %s, %s)",
+                                    [(i, 'v%d' % i, i) for i in range(1, 6)])
+        self.src.conn.commit()
+
+    def tearDown(self):
+        self.src.drop_tables(['test_sync', 'test_sync_null', 'test_sync_ci'])
+        self.dst.drop_tables(['test_sync', 'test_sync_ci', 'sync_watermarks'])
+
+    def get_dst_rows(self):
+        self.dst.cursor.execute("SELECT `id`, `v` FROM `test_sync` ORDER BY `id`")
+        return list(self.dst.cursor.fetchall())
+
+    def test_sync_upsert_and_delete(self):
+        result = pymysql_tools.sync_table(self.src, self.dst, 'test_sync', batch_rows=2)
+        self.assertEqual((result['upserted'], result['watermark']), (5, 5))
+        self.src.cursor.execute("UPDATE `test_sync` SET `v`='new', `updated_at`=6 WHERE `id`=2")
+        self.src.cursor.execute("DELETE FROM `test_sync` WHERE `id`=4")
+        self.src.conn.commit()
+        result = pymysql_tools.sync_table(self.src, self.dst, 'test_sync', batch_rows=2, detect_deletes=True)
+        # only rows with updated_at >= 5 are copied again
+        self.assertEqual((result['upserted'], result['deleted']), (2, 1))
+        self.assertEqual(self.get_dst_rows(), [(1, 'v1'), (2, 'new'), (3, 'v3'), (5, 'v5')])
+
+    def test_sync_delete_compares_keys_with_collation(self):
+        self.src.cursor.execute("""CREATE TABLE `test_sync_ci` (`id` varchar(10) NOT NULL PRIMARY KEY,
+            `updated_at` int NOT NULL) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci""")
+        self.src.cursor.executemany("INSERT INTO `test_sync_ci` VALUES (%s, %s)", [('abc', 1), ('def', 1)])
+        self.src.conn.commit()
+        pymysql_tools.sync_table(self.src, self.dst, 'test_sync_ci')
+        # the upsert keeps the old key 'abc' in the destination, it is the same key as 'ABC'
+        self.src.cursor.execute("UPDATE `test_sync_ci` SET `id`='ABC', `updated_at`=2 WHERE `id`='abc'")
+        self.src.conn.commit()
+        result = pymysql_tools.sync_table(self.src, self.dst, 'test_sync_ci', detect_deletes=True)
+        self.assertEqual(result['deleted'], 0)
+        self.dst.cursor.execute("SELECT count(*) FROM `test_sync_ci`")
+        self.assertEqual(self.dst.cursor.fetchone()[0], 2)
+
+    def test_sync_refuses_nullable_watermark(self):
+        self.src.cursor.execute("CREATE TABLE `test_sync_null` (`id` int NOT NULL PRIMARY KEY, `updated_at` int)")
+        with self.assertRaises(ValueError):
+            pymysql_tools.sync_table(self.src, self.dst, 'test_sync_null')
+
+
+class TestExecuteDDL(unittest.TestCase):
+
+    def setUp(self):
+        self.pt = pymysql_tools.connect(host, user, passwd, database)
+        self.other = pymysql_tools.connect(host, user, passwd, database)
+        self.pt.cursor.execute("CREATE TABLE `test_ddl` (`id` int NOT NULL PRIMARY KEY) ENGINE=InnoDB")
+
+    def tearDown(self):
+        self.other.conn.rollback()
+        self.pt.drop_table('test_ddl')
+
+    def test_execute_ddl_retries_while_blocked(self):
+        # an open transaction which read the table holds a shared metadata lock
+        self.other.conn.begin()
+        self.other.cursor.execute("SELECT * FROM `test_ddl`")
+        with self.assertRaises(pymysql.err.OperationalError) as context:
+            self.pt.execute_ddl("ALTER TABLE `test_ddl` ADD `v` int", 'test_ddl', lock_wait_timeout=1,
+                                retries=1, backoff=0.01)
+        self.assertEqual(context.exception.args[0], 1205)
+        self.assertEqual(self.pt.last_ddl_report['attempts'], 2)
+        # session lock_wait_timeout is restored
+        self.pt.cursor.execute("SELECT @@SESSION.lock_wait_timeout")
+        self.assertNotEqual(self.pt.cursor.fetchone()[0], 1)
+
+    def test_execute_ddl_after_blocker_finished(self):
+        self.other.conn.begin()
+        self.other.cursor.execute("SELECT * FROM `test_ddl`")
+        self.other.conn.commit()
+        self.pt.execute_ddl("ALTER TABLE `test_ddl` ADD `v` int", 'test_ddl', lock_wait_timeout=1, retries=1)
+        self.assertEqual(self.pt.last_ddl_report['attempts'], 1)
+        self.assertEqual(self.pt.last_ddl_report['blockers'], [])
+        self.assertTrue(self.pt.column_exists('test_ddl', 'v'))
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from pymysql_tools import MySQLTools
+
+
+def index(name, columns, unique=False, index_type='BTREE', comment='', visible=True):
+    return {'name': name, 'unique': unique, 'type': index_type, 'comment': comment, 'visible': visible,
+            'columns': columns}
+
+
+class RecordingTools(MySQLTools):
+    """MySQLTools without connection, execute_ddl records the statements and fails for statements with fail_on"""
+
+    def __init__(self, fail_on=()):
+        self.statements = []
+        self.fail_on = fail_on
+
+    def execute_ddl(self, sql, table=None, **kwargs):
+        self.statements.append(sql)
+        if any(x in sql for x in self.fail_on):
+            raise ValueError("failed: " + sql)
+
+
+class TestIndexDefinitionSQL(unittest.TestCase):
+
+    def test_composite_unique(self):
+        self.assertEqual(MySQLTools.index_definition_sql(index('u', [('a', None, '', None), ('b', 10, 'DESC', None)],
+                                                               unique=True)),
+                         "ADD UNIQUE INDEX `u` (`a`, `b`(10) DESC) USING BTREE")
+
+    def test_fulltext(self):
+        self.assertEqual(MySQLTools.index_definition_sql(index('f', [('t', None, '', None)], index_type='FULLTEXT')),
+                         "ADD FULLTEXT INDEX `f` (`t`)")
+
+    def test_functional_comment_invisible(self):
+        self.assertEqual(MySQLTools.index_definition_sql(index('e', [(None, None, '', "(`a` + 1)")],
+                                                               comment="it's", visible=False)),
+                         "ADD INDEX `e` (((`a` + 1))) USING BTREE COMMENT 'it''s' INVISIBLE")
+
+    def test_not_recreatable(self):
+        with self.assertRaises(ValueError):
+            MySQLTools.index_definition_sql(index('x', [(None, None, '', None)]))
+
+
+class TestRebuildIndices(unittest.TestCase):
+
+    indices = [index('k', [('a', None, '', None)]), index('f1', [('t', None, '', None)], index_type='FULLTEXT'),
+               index('u', [('b', None, '', None)], unique=True),
+               index('f2', [('s', None, '', None)], index_type='FULLTEXT')]
+
+    def test_fulltext_separate(self):
+        tools = RecordingTools()
+        self.assertEqual(tools._MySQLTools__rebuild_indices('t', self.indices), [])
+        self.assertEqual(tools.statements, [
+            "ALTER TABLE `t` ADD INDEX `k` (`a`) USING BTREE, ADD UNIQUE INDEX `u` (`b`) USING BTREE",
+            "ALTER TABLE `t` ADD FULLTEXT INDEX `f1` (`t`)", "ALTER TABLE `t` ADD FULLTEXT INDEX `f2` (`s`)"])
+
+    def test_retry_one_by_one(self):
+        tools = RecordingTools(fail_on=('`u`',))
+        failed = tools._MySQLTools__rebuild_indices('t', self.indices)
+        self.assertEqual([name for name, e in failed], ['u'])
+        self.assertIn("ALTER TABLE `t` ADD INDEX `k` (`a`) USING BTREE", tools.statements)
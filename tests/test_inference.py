@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from pymysql_tools.inference import ColumnTypeInference, TableTypeInference, column_bytes
+
+
+def infer(values, enum_max=16):
+    column = ColumnTypeInference(enum_max)
+    for value in values:
+        column.add(value)
+    return column.sql_type()
+
+
+class TestColumnTypeInference(unittest.TestCase):
+
+    def test_integers(self):
+        self.assertEqual(infer(['1', '255']), 'tinyint unsigned NOT NULL')
+        self.assertEqual(infer(['-1', '127']), 'tinyint NOT NULL')
+        self.assertEqual(infer(['1', '256', '']), 'smallint unsigned NULL')
+        self.assertEqual(infer(['-1', str(2 ** 31)]), 'bigint NOT NULL')
+        self.assertEqual(infer(['1', str(2 ** 64)]), 'decimal(20,0) NOT NULL')
+
+    def test_leading_zeros_are_strings(self):
+        self.assertEqual(infer(['007', '8'], enum_max=0), 'varchar(3) NOT NULL')
+
+    def test_decimals(self):
+        self.assertEqual(infer(['-3.25', '10', '0.5']), 'decimal(4,2) NOT NULL')
+
+    def test_dates(self):
+        self.assertEqual(infer(['2017-01-02', '2016-02-29']), 'date NOT NULL')
+        self.assertEqual(infer(['2017-01-02', '2017-01-02 10:00:00']), 'datetime NOT NULL')
+        self.assertEqual(infer(['2017-01-02T10:00:00.5']), 'datetime(6) NOT NULL')
+
+    def test_impossible_dates(self):
+        self.assertEqual(infer(['2017-01-02', '2017-02-30'], enum_max=0), 'varchar(10) NOT NULL')
+        self.assertEqual(infer(['2017-02-30 10:00:00'], enum_max=0), 'varchar(19) NOT NULL')
+
+    def test_enum(self):
+        self.assertEqual(infer(['b', 'a', "it's"] * 4), "enum('a','b','it''s') NOT NULL")
+        # too few rows per distinct value
+        self.assertEqual(infer(['b', 'a']), 'varchar(1) NOT NULL')
+        self.assertEqual(infer([str(x) + 'x' for x in range(20)] * 4), 'varchar(3) NOT NULL')
+
+    def test_enum_case_insensitive_duplicates(self):
+        self.assertEqual(infer(['Yes', 'yes', 'No', 'no'] * 4), 'varchar(3) NOT NULL')
+        self.assertEqual(infer(['e', 'é'] * 4), 'varchar(1) NOT NULL')
+        self.assertEqual(infer(['a', 'a '] * 4), 'varchar(2) NOT NULL')
+
+    def test_strings(self):
+        self.assertEqual(infer(['', ''], enum_max=0), 'varchar(1) NULL')
+        self.assertEqual(infer(['x' * 300]), 'text NOT NULL')
+        self.assertEqual(infer(['x' * 20000]), 'mediumtext NOT NULL')
+
+
+class TestTableTypeInference(unittest.TestCase):
+
+    def test_table(self):
+        table = TableTypeInference(3)
+        for row in (['1', 'a', ''], [], ['2', '', '2017-01-01'], ['3']):
+            table.add(row)
+        self.assertEqual(table.sql_types(), ['tinyint unsigned NOT NULL', 'varchar(1) NULL', 'date NULL'])
+        self.assertEqual(table.empty_to_null(), {0, 2})
+
+    def test_freeze_enums(self):
+        table = TableTypeInference(1)
+        table.add(['a'])
+        table.freeze_enums()
+        for i in range(10):
+            table.add(['a'])
+        self.assertEqual(table.sql_types(), ['varchar(1) NOT NULL'])
+
+    def test_row_size_budget(self):
+        table = TableTypeInference(100)
+        table.add(['x' * 255] * 100)
+        sql_types = table.sql_types()
+        # 255 characters * 4 bytes + 2 = 1022 bytes, 63 of them fit next to 37 text columns
+        self.assertEqual(sql_types[:63], ['varchar(255) NOT NULL'] * 63)
+        self.assertEqual(sql_types[63:], ['text NOT NULL'] * 37)
+        self.assertLessEqual(sum([column_bytes(x) for x in sql_types]), 65535)
+        # single byte charset
+        table.max_bytes_per_char = 1
+        table.text_columns = set()
+        self.assertEqual(table.sql_types(), ['varchar(255) NOT NULL'] * 100)
+
+    def test_text_columns_stay_text(self):
+        table = TableTypeInference(2)
+        table.add(['x' * 255, 'y'])
+        table.text_columns.add(0)
+        table.add(['x', 'y'])
+        self.assertEqual(table.sql_types(), ['text NOT NULL', 'varchar(1) NOT NULL'])
+
+    def test_column_bytes(self):
+        self.assertEqual(column_bytes('varchar(10) NULL'), 41)
+        self.assertEqual(column_bytes('varchar(100) NULL'), 402)
+        self.assertEqual(column_bytes('varchar(100) NULL', 1), 101)
+        self.assertEqual(column_bytes('decimal(20,2) NOT NULL'), 9)
+        self.assertEqual(column_bytes('smallint unsigned NULL'), 2)
+        self.assertEqual(column_bytes("enum('a','b') NULL"), 2)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from pymysql_tools.parallel import csv_reader, insert_rows, record_end, split_csv_file, _iter_lines, \
+    _drop_staging_tables
+
+
+class RecordingCursor:
+    """cursor which only records executemany calls"""
+
+    def __init__(self):
+        self.calls = []
+
+    def executemany(self, sql, values):
+        self.calls.append((sql, values))
+
+
+class TablesTools:
+    """MySQLTools replacement which only knows table names"""
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def get_table_names(self):
+        return list(self.tables)
+
+    def drop_table(self, table):
+        self.tables.remove(table)
+
+
+class TestParallel(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'test.csv')
+        with open(self.path, 'wb') as fd:
+            fd.write(b'a\t"x\ny"\tb\nc\td\te\n"q"\tr\ts\n')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def read_range(self, start, end, quotechar='"'):
+        with open(self.path, 'rb') as fd:
+            return list(csv_reader(_iter_lines(fd, start, end, 'utf-8'), '\t', quotechar))
+
+    def test_record_end_quoted_newline(self):
+        self.assertEqual([record_end(self.path, x, '"') for x in (0, 1, 5, 10, 11, 17, 24)],
+                         [0, 10, 10, 10, 16, 24, 24])
+        # without quotechar every newline ends a record
+        self.assertEqual(record_end(self.path, 1), 5)
+
+    def test_split_csv_file(self):
+        ranges = split_csv_file(self.path, 4, 0, '"')
+        self.assertEqual(ranges, [(0, 10), (10, 16), (16, 24)])
+        rows = [row for start, end in ranges for row in self.read_range(start, end)]
+        self.assertEqual(rows, [['a', 'x\ny', 'b'], ['c', 'd', 'e'], ['q', 'r', 's']])
+        self.assertEqual(split_csv_file(self.path, 8, 10, '"'), [(10, 16), (16, 24)])
+
+    def test_split_stray_quotes(self):
+        # a quote inside an unquoted field (5" wide) is a literal for csv.reader and must not flip the state
+        records = []
+        for i in range(40):
+            if i % 3 == 0:
+                records.append('%d\t5" wide\tx' % i)
+            elif i % 3 == 1:
+                records.append('%d\t"multi\nline ""%d"""\ty' % (i, i))
+            else:
+                records.append('%d\t"a"\t1"2"3' % i)
+        with open(self.path, 'w', newline='') as fd:
+            fd.write("\n".join(records) + "\n")
+        expected = self.read_range(0, os.path.getsize(self.path))
+        self.assertEqual(len(expected), 40)
+        ranges = split_csv_file(self.path, 6, 0, '"')
+        self.assertEqual(len(ranges), 6)
+        self.assertEqual([row for start, end in ranges for row in self.read_range(start, end)], expected)
+
+    def test_large_field(self):
+        with open(self.path, 'w') as fd:
+            fd.write('1\t' + 'x' * 200000 + '\n')
+        rows = self.read_range(0, os.path.getsize(self.path), None)
+        self.assertEqual(len(rows[0][1]), 200000)
+
+    def test_insert_rows(self):
+        cursor = RecordingCursor()
+        loaded = insert_rows(cursor, 't', 3, [[' 1 ', ''], [], ['2', 'b', 'c', 'd']], empty_to_null={1})
+        self.assertEqual(loaded, 2)
+        self.assertEqual(cursor.calls, [("INSERT INTO `t` VALUES (%s, %s, %s)", [['1', None, ''], ['2', 'b', 'c']])])
+
+    def test_drop_staging_tables(self):
+        tools = TablesTools(['t', 't_stage_12', 't_stage_34', 't_stage_x', 'u_stage_56', 't_staged'])
+        _drop_staging_tables(tools, 't')
+        self.assertEqual(tools.tables, ['t', 't_stage_x', 'u_stage_56', 't_staged'])